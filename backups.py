@@ -0,0 +1,340 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: backups are only serialized within one process
+    fcntl = None
+
+# Pages copied per backup step, and the pause between steps that lets writers in
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_SLEEP = 0.005  # seconds
+
+# Backups are split into fixed-size chunks on SQLite page boundaries (16 default-sized
+# pages), so pages that didn't change since the last backup map to chunks already stored
+CHUNK_SIZE = 64 * 1024
+READ_SIZE = 1024 * 1024
+MANIFEST_SUFFIX = '.manifest.json'
+# Running totals for the backups folder, kept next to the backups so they survive a restore
+USAGE_FILE = '.usage.json'
+
+
+def snapshot(engine, path, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP):
+    """Copy the live database to `path` with SQLite's online backup API.
+
+    The copy runs in steps of `pages` pages so writers are only held off for one step
+    at a time; a write from another connection makes SQLite restart the copy, so the
+    result is always a consistent snapshot.
+    """
+    raw = engine.raw_connection()
+    try:
+        target = sqlite3.connect(path)
+        try:
+            raw.connection.backup(target, pages=pages, sleep=sleep)
+        finally:
+            target.close()
+    finally:
+        raw.close()
+
+
+class StoreLock:
+    """Reentrant lock that also holds an exclusive flock on `path` while it's held.
+
+    The thread lock covers threads in this process; the flock covers other processes
+    using the same backups folder (another app worker, `flask run-scheduler`).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+
+class ChunkStore:
+    """Content-addressed, zlib-compressed chunks under `root`, named by the sha256 of their raw bytes"""
+
+    def __init__(self, root, level=6):
+        self.root = root
+        self.level = level
+        # Held while a backup writes chunks, while gc sweeps and around updates to the usage
+        # totals, so gc can't remove a chunk a half-written manifest is about to reference
+        # and two writers can't lose each other's totals, whichever process they run in
+        self.lock = StoreLock(os.path.join(root, '.lock'))
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data):
+        """Store `data` unless it's already there; returns (digest, bytes written)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, self.level)
+        partial = f'{path}.{os.getpid()}.part'
+        with open(partial, 'wb') as f:
+            f.write(compressed)
+        os.replace(partial, path)
+        return digest, len(compressed)
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def digests(self):
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.listdir(self.root):
+            folder = os.path.join(self.root, prefix)
+            if os.path.isdir(folder):
+                for name in os.listdir(folder):
+                    if not name.endswith('.part'):
+                        yield name
+
+    def disk_usage(self):
+        return sum(os.path.getsize(self.path(digest)) for digest in self.digests())
+
+    def gc(self, manifest_folder):
+        """Delete chunks no manifest in `manifest_folder` refers to; returns (chunks, bytes) freed"""
+        with self.lock:
+            usage = read_usage(manifest_folder, self)
+            live = set()
+            for manifest in list_manifests(manifest_folder):
+                live.update(read_manifest(os.path.join(manifest_folder, manifest))['chunks'])
+            removed = freed = 0
+            for digest in list(self.digests()):
+                if digest not in live:
+                    path = self.path(digest)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+            if freed:
+                _write_usage(manifest_folder, usage['backups'], usage['bytes'] - freed)
+            return removed, freed
+
+
+def list_manifests(folder):
+    return [name for name in os.listdir(folder) if name.endswith(MANIFEST_SUFFIX)]
+
+
+def read_manifest(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def create_backup_file(engine, folder, name, store):
+    """Snapshot the database and store it as a manifest over `store`'s chunks.
+
+    Only chunks the store doesn't already have are written. Returns the manifest's
+    filename, the bytes this backup added, the raw size, sha256 checksum and duration.
+    """
+    start = time.monotonic()
+    filename = f'{name}{MANIFEST_SUFFIX}'
+    suffix = 1
+    while os.path.exists(os.path.join(folder, filename)):
+        # Two backups within the same second
+        filename = f'{name}_{suffix}{MANIFEST_SUFFIX}'
+        suffix += 1
+    path = os.path.join(folder, filename)
+    snapshot_path = os.path.join(folder, f'.{name}.snapshot')
+    digest = hashlib.sha256()
+    chunks = []
+    raw_size = written = 0
+    try:
+        snapshot(engine, snapshot_path)
+        with store.lock:
+            # Start the running totals before this backup adds to the folder
+            read_usage(folder, store)
+            with open(snapshot_path, 'rb') as src:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    raw_size += len(chunk)
+                    chunk_digest, chunk_bytes = store.put(chunk)
+                    chunks.append(chunk_digest)
+                    written += chunk_bytes
+            manifest = {'version': 1, 'chunk_size': CHUNK_SIZE, 'raw_size': raw_size,
+                        'sha256': digest.hexdigest(), 'chunks': chunks}
+            with open(path + '.part', 'w') as f:
+                json.dump(manifest, f)
+            os.replace(path + '.part', path)
+            size = written + os.path.getsize(path)
+            adjust_usage(folder, store, backups=1, size=size)
+    finally:
+        for leftover in (snapshot_path, path + '.part'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return {
+        'filename': filename,
+        'size': size,
+        'raw_size': raw_size,
+        'checksum': digest.hexdigest(),
+        'duration': time.monotonic() - start,
+    }
+
+
+def download_name(filename):
+    """Name a backup is served under, always the plain database file"""
+    for suffix in (MANIFEST_SUFFIX, '.db.gz'):
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)] + '.db'
+    return filename
+
+
+def iter_backup(folder, filename, store):
+    """Yield the raw database bytes of a backup, whichever format it was stored in"""
+    path = os.path.join(folder, filename)
+    if filename.endswith(MANIFEST_SUFFIX):
+        for digest in read_manifest(path)['chunks']:
+            yield store.get(digest)
+        return
+    # Older backups: a gzipped or plain copy of the database file
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def backup_exists(folder, filename):
+    return os.path.exists(os.path.join(folder, filename))
+
+
+def verify_backup_file(folder, filename, checksum, store):
+    """True if the reassembled backup still matches its recorded checksum"""
+    digest = hashlib.sha256()
+    try:
+        for chunk in iter_backup(folder, filename, store):
+            digest.update(chunk)
+    except (OSError, zlib.error):
+        return False
+    return digest.hexdigest() == checksum
+
+
+def remove_backup_file(folder, filename, store):
+    """Delete a backup's manifest or file; its chunks go at the next gc"""
+    path = os.path.join(folder, filename)
+    with store.lock:
+        read_usage(folder, store)
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            os.remove(path)
+            adjust_usage(folder, store, backups=-1, size=-size)
+
+
+def restore_backup(engine, folder, filename, store, checksum=None):
+    """Copy a backup over the live database through the online backup API.
+
+    The backup is reassembled into a temporary file and checked first, so a damaged
+    backup never touches the live database.
+    """
+    fd, path = tempfile.mkstemp(prefix='.restore-', suffix='.db', dir=folder)
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter_backup(folder, filename, store):
+                digest.update(chunk)
+                f.write(chunk)
+        if checksum and digest.hexdigest() != checksum:
+            raise ValueError(f'{filename} does not match its checksum')
+        source = sqlite3.connect(path)
+        try:
+            if source.execute('PRAGMA integrity_check').fetchone()[0] != 'ok':
+                raise ValueError(f'{filename} is not a valid database')
+            raw = engine.raw_connection()
+            try:
+                # The app's code expects the schema it's migrated to
+                backup_revision = schema_revision(source)
+                live_revision = schema_revision(raw.connection)
+                if backup_revision != live_revision:
+                    raise ValueError(f'{filename} is at schema revision {backup_revision}, '
+                                     f'the database is at {live_revision}')
+                source.backup(raw.connection, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP)
+            finally:
+                raw.close()
+        finally:
+            source.close()
+    finally:
+        os.remove(path)
+
+
+def schema_revision(conn):
+    try:
+        row = conn.execute('SELECT version_num FROM alembic_version').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def folder_usage(folder, store):
+    """Walk `folder`: (number of backups, bytes used by them and the shared chunk store)"""
+    count = total = 0
+    for entry in os.scandir(folder):
+        if entry.is_file() and not entry.name.startswith('.'):
+            count += 1
+            total += entry.stat().st_size
+    return count, total + store.disk_usage()
+
+
+def _write_usage(folder, backups, size):
+    path = os.path.join(folder, USAGE_FILE)
+    with open(path + '.part', 'w') as f:
+        json.dump({'backups': backups, 'bytes': size}, f)
+    os.replace(path + '.part', path)
+
+
+def read_usage(folder, store):
+    """{'backups': n, 'bytes': total} from the running totals, walking the folder only if
+    they've never been recorded (or were lost)
+    """
+    with store.lock:
+        try:
+            with open(os.path.join(folder, USAGE_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            backups, size = folder_usage(folder, store)
+            _write_usage(folder, backups, size)
+            return {'backups': backups, 'bytes': size}
+
+
+def adjust_usage(folder, store, backups=0, size=0):
+    with store.lock:
+        usage = read_usage(folder, store)
+        _write_usage(folder, usage['backups'] + backups, usage['bytes'] + size)
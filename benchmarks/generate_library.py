@@ -0,0 +1,353 @@
+"""Seeded synthetic library for benchmarking the app beyond a hobby-sized collection.
+
+Builds a fresh database with the app's schema and fills it with books (repeat copies,
+categories, tags, soft deletes), lendings, reading list items and request logs. Then it
+derives what the app would have: category/tag links, the lending pointers, the search
+index, the /metrics counters and the request log rollups. The same --seed always gives
+the same library. Run from the repository root:
+
+    python benchmarks/generate_library.py --output /tmp/large.db \\
+        --books 100000 --lendings 1000000 --reading-list 50000 --request-logs 5000000
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, insert, select, text  # noqa: E402
+
+from models import db, Book, BookLending, ReadingListItem, RequestLog  # noqa: E402
+from metrics_store import reconcile_metrics  # noqa: E402
+from reading_order import ORDER_GAP  # noqa: E402
+from rollups import compact_request_logs  # noqa: E402
+from search_index import create_search_index  # noqa: E402
+from sqlite_profile import configure_engine  # noqa: E402
+from taxonomy import backfill_taxonomy  # noqa: E402
+
+BATCH_SIZE = 20000
+
+# Genres by how common they are on a shelf, most common first
+CATEGORIES = [
+    'Fiction', 'History', 'Biography', 'Science', 'Fantasy', 'Mystery', 'Sci-Fi', 'Philosophy',
+    'Poetry', 'Travel', 'Cooking', 'Art', 'Politics', 'Economics', 'Psychology', 'Religion',
+    'Horror', 'Romance', 'Children', 'Reference',
+]
+TAGS = [
+    'favorite', 'signed', 'first-edition', 'gift', 'to-reread', 'book-club', 'hardcover',
+    'paperback', 'classic', 'award-winner', 'series', 'loaned-often', 'annotated', 'rare',
+    'secondhand', 'translated', 'illustrated', 'reference', 'school', 'wishlist',
+]
+TITLE_OPENERS = ['The', 'A', 'Beyond the', 'Notes on the', 'Return of the', 'Letters from the',
+                 'Under the', 'History of the', 'Songs of the', 'Last']
+TITLE_ADJECTIVES = ['Silent', 'Burning', 'Hidden', 'Northern', 'Broken', 'Golden', 'Endless',
+                    'Lost', 'Crimson', 'Quiet', 'Distant', 'Iron', 'Winter', 'Forgotten', 'Bright']
+TITLE_NOUNS = ['River', 'Garden', 'Empire', 'Harbor', 'Library', 'Mountain', 'Kingdom', 'Storm',
+               'Archive', 'Machine', 'Forest', 'City', 'Voyage', 'Orchard', 'Lighthouse', 'Atlas']
+FIRST_NAMES = ['Ada', 'Ben', 'Clara', 'Dev', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jonas',
+               'Kemi', 'Liam', 'Maya', 'Nils', 'Olga', 'Pavel', 'Quinn', 'Rosa', 'Sami', 'Tove']
+LAST_NAMES = ['Abbott', 'Brandt', 'Castillo', 'Dubois', 'Eriksen', 'Fischer', 'Gupta', 'Haddad',
+              'Ivanova', 'Jensen', 'Kowalski', 'Lindqvist', 'Moreau', 'Nakamura', 'Okafor',
+              'Petrov', 'Quintero', 'Rossi', 'Schmidt', 'Tanaka', 'Urquhart', 'Valdez']
+
+# (endpoint, method, status, path template, share of traffic, typical seconds)
+TRAFFIC = [
+    ('index', 'GET', 200, '/', 35, 0.020),
+    ('suggest_books', 'GET', 200, '/api/books/suggest?q=the', 15, 0.004),
+    ('lending_history', 'GET', 200, '/book/{id}/lending', 7, 0.015),
+    ('reading_list', 'GET', 200, '/reading_list', 8, 0.030),
+    ('all_lending_history', 'GET', 200, '/lending_history', 5, 0.025),
+    ('edit_book', 'GET', 200, '/edit_book/{id}', 4, 0.010),
+    ('edit_book', 'POST', 302, '/edit_book/{id}', 2, 0.030),
+    ('add_book', 'GET', 200, '/add_book', 3, 0.008),
+    ('add_book', 'POST', 302, '/add_book', 3, 0.600),
+    ('metrics', 'GET', 200, '/metrics', 4, 0.040),
+    ('currently_lent', 'GET', 200, '/currently-lent', 3, 0.015),
+    ('admin_panel', 'GET', 200, '/admin', 3, 0.060),
+    ('add_to_reading_list', 'POST', 302, '/reading_list/add/{id}', 3, 0.020),
+    ('reorder_reading_list', 'POST', 200, '/reading_list/reorder', 2, 0.010),
+    ('mark_book_read', 'POST', 302, '/mark_book_read/{id}', 2, 0.020),
+    ('lookup_isbn', 'GET', 200, '/lookup_isbn/{isbn}', 1, 0.400),
+]
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+]
+
+# Shares of the library in each state
+EXTRA_COPY_SHARE = 0.08      # works owned more than once
+DELETED_BOOK_SHARE = 0.03    # books in the trash
+READ_SHARE = 0.45
+DELETED_LENDING_SHARE = 0.02
+OPEN_LENDING_SHARE = 0.02    # active books lent out right now
+COMPLETED_ITEM_SHARE = 0.6
+ERROR_SHARE = 0.004          # requests that ended in a 500
+NOT_FOUND_SHARE = 0.01
+LOG_DAYS = 28                # inside the default raw log retention, so compaction keeps them all
+
+
+def zipf_weights(n, s=1.0):
+    """Cumulative weights for rng.choices, so item k is picked ~1/k^s as often as the first"""
+    return list(itertools.accumulate(1 / (k + 1) ** s for k in range(n)))
+
+
+def isbn13(number):
+    """A valid ISBN-13 in the 978 range for an integer"""
+    digits = f'978{number % 10 ** 9:09d}'
+    check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return digits + str(check)
+
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_rows(engine, table, rows):
+    count = 0
+    for batch in batched(rows):
+        with engine.begin() as conn:
+            conn.execute(insert(table), batch)
+        count += len(batch)
+    return count
+
+
+def book_rows(rng, count, today, now):
+    authors = [f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES]
+    rng.shuffle(authors)
+    author_weights = zipf_weights(len(authors), 0.8)
+    category_weights = zipf_weights(len(CATEGORIES))
+    tag_weights = zipf_weights(len(TAGS))
+
+    made, work = 0, 0
+    while made < count:
+        work += 1
+        title = f'{rng.choice(TITLE_OPENERS)} {rng.choice(TITLE_ADJECTIVES)} {rng.choice(TITLE_NOUNS)}'
+        if rng.random() < 0.3:
+            title += f', Volume {rng.randint(1, 7)}'
+        categories = sorted(set(rng.choices(CATEGORIES, cum_weights=category_weights, k=rng.randint(1, 3))))
+        tags = sorted(set(rng.choices(TAGS, cum_weights=tag_weights, k=rng.randint(0, 3)))) \
+            if rng.random() < 0.6 else []
+        pages = min(max(int(rng.lognormvariate(5.7, 0.45)), 40), 1800)
+        shared = {
+            'title': title,
+            'author': rng.choices(authors, cum_weights=author_weights)[0],
+            'isbn': isbn13(work * 7919) if rng.random() < 0.95 else None,
+            'publication_date': str(today.year - min(int(abs(rng.gauss(0, 25))), 300)),
+            'pages': pages,
+            'chapters': max(pages // rng.randint(12, 30), 1) if rng.random() < 0.7 else None,
+            'categories': ', '.join(categories),
+            'tags': ', '.join(tags),
+        }
+        copies = 1
+        if rng.random() < EXTRA_COPY_SHARE:
+            copies = 2 if rng.random() < 0.8 else 3
+        for copy_number in range(1, min(copies, count - made) + 1):
+            acquired = today - timedelta(days=min(int(rng.expovariate(1 / 900)), 20 * 365))
+            read = rng.random() < READ_SHARE
+            deleted = rng.random() < DELETED_BOOK_SHARE
+            yield {
+                **shared,
+                'copy_number': copy_number,
+                'acquisition_date': acquired,
+                'notes': 'Picked up at a used book sale' if rng.random() < 0.1 else None,
+                'read': read,
+                'read_date': acquired + timedelta(days=rng.randint(0, max((today - acquired).days, 0)))
+                if read else None,
+                'deleted': deleted,
+                'deleted_at': now - timedelta(days=rng.randint(0, 180), seconds=rng.randint(0, 86399))
+                if deleted else None,
+                'is_lent': False,
+            }
+            made += 1
+
+
+def lending_rows(rng, count, active_ids, today, now):
+    borrowers = [f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES[:8]]
+    borrower_weights = zipf_weights(len(borrowers))
+    # A few books get borrowed far more often than the rest
+    popular = list(active_ids)
+    rng.shuffle(popular)
+    popularity = zipf_weights(len(popular), 0.7)
+
+    # Only one open lending per book, so those come from a sample of distinct books
+    open_count = min(int(len(active_ids) * OPEN_LENDING_SHARE), count // 10)
+    open_books = set(rng.sample(active_ids, open_count))
+    for i in range(count - open_count):
+        lent = today - timedelta(days=rng.randint(30, 10 * 365))
+        deleted = rng.random() < DELETED_LENDING_SHARE
+        yield {
+            'book_id': rng.choices(popular, cum_weights=popularity)[0],
+            'borrower_name': rng.choices(borrowers, cum_weights=borrower_weights)[0],
+            'lent_date': lent,
+            'due_date': lent + timedelta(days=rng.choice((14, 21, 30))),
+            'return_date': min(lent + timedelta(days=int(rng.expovariate(1 / 18)) + 1), today),
+            'notes': None,
+            'deleted': deleted,
+            'deleted_at': now - timedelta(days=rng.randint(0, 180)) if deleted else None,
+        }
+    for book_id in sorted(open_books):
+        # Some of these are well past due, for the overdue count
+        lent = today - timedelta(days=rng.randint(0, 90))
+        yield {
+            'book_id': book_id,
+            'borrower_name': rng.choices(borrowers, cum_weights=borrower_weights)[0],
+            'lent_date': lent,
+            'due_date': lent + timedelta(days=21),
+            'return_date': None,
+            'notes': None,
+            'deleted': False,
+            'deleted_at': None,
+        }
+
+
+def reading_list_rows(rng, count, active_ids, today):
+    book_ids = rng.sample(active_ids, count) if count <= len(active_ids) else \
+        rng.choices(active_ids, k=count)
+    for i, book_id in enumerate(book_ids):
+        added = today - timedelta(days=rng.randint(0, 6 * 365))
+        completed = rng.random() < COMPLETED_ITEM_SHARE
+        yield {
+            'book_id': book_id,
+            'order': (i + 1) * ORDER_GAP,
+            'added_date': added,
+            'notes': None,
+            'completed': completed,
+            'completed_date': min(added + timedelta(days=int(rng.expovariate(1 / 25))), today)
+            if completed else None,
+        }
+
+
+def request_log_rows(rng, count, book_ids, now):
+    weights = list(itertools.accumulate(share for *_, share, _ in TRAFFIC))
+    ips = [f'192.168.1.{i}' for i in range(2, 40)] + [f'10.0.0.{i}' for i in range(2, 12)]
+    span = timedelta(days=LOG_DAYS).total_seconds()
+    for i in range(count):
+        endpoint, method, status, path, _, typical = rng.choices(TRAFFIC, cum_weights=weights)[0]
+        roll = rng.random()
+        if roll < ERROR_SHARE:
+            status, typical = 500, typical * 3
+        elif roll < ERROR_SHARE + NOT_FOUND_SHARE:
+            status = 404
+        book_id = rng.choice(book_ids)
+        # In id order, oldest first, the way the writer appends them
+        yield {
+            'timestamp': now - timedelta(seconds=span * (count - i) / count),
+            'method': method,
+            'path': path.format(id=book_id, isbn=isbn13(book_id)),
+            'endpoint': endpoint,
+            'status_code': status,
+            'ip_address': rng.choice(ips),
+            'user_agent': rng.choice(USER_AGENTS),
+            'response_time': rng.lognormvariate(math.log(typical), 0.6),
+        }
+
+
+def generate(engine, books, lendings, reading_list, request_logs, seed=42, rollups=True, log=print):
+    """Fill the empty database behind `engine`; returns the row count per table"""
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow()
+
+    def step(message, work):
+        start = time.perf_counter()
+        result = work()
+        log(f"  {message} ({time.perf_counter() - start:.1f}s)")
+        return result
+
+    db.Model.metadata.create_all(engine)
+    step(f"{books} books", lambda: insert_rows(engine, Book.__table__, book_rows(rng, books, today, now)))
+
+    with engine.connect() as conn:
+        active_ids = conn.execute(select(Book.id).where(Book.deleted == False).order_by(Book.id)).scalars().all()
+        all_ids = conn.execute(select(Book.id).order_by(Book.id)).scalars().all()
+    step(f"{lendings} lendings", lambda: insert_rows(
+        engine, BookLending.__table__, lending_rows(rng, lendings, active_ids, today, now)))
+    step("lending pointers", lambda: set_lending_pointers(engine))
+    step(f"{reading_list} reading list items", lambda: insert_rows(
+        engine, ReadingListItem.__table__, reading_list_rows(rng, reading_list, active_ids, today)))
+    step(f"{request_logs} request logs", lambda: insert_rows(
+        engine, RequestLog.__table__, request_log_rows(rng, request_logs, all_ids, now)))
+
+    step("category and tag links", lambda: backfill_taxonomy(engine, batch_size=5000))
+    step("search index", lambda: create_search_index(engine))
+    step("metrics counters", lambda: reconcile_metrics(engine))
+    if rollups:
+        step("request log rollups", lambda: compact_request_logs(engine, batch_size=50000))
+    step("ANALYZE", lambda: _analyze(engine))
+    return row_counts(engine)
+
+
+def set_lending_pointers(engine):
+    # Same state refresh_lending_state leaves behind, for every book at once
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE books SET current_lending_id = active.id, is_lent = 1 "
+            "FROM (SELECT id, book_id FROM book_lending WHERE return_date IS NULL AND deleted = 0) AS active "
+            "WHERE active.book_id = books.id"
+        ))
+
+
+def _analyze(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+
+
+def row_counts(engine):
+    tables = ('books', 'book_lending', 'reading_list_item', 'request_logs', 'request_log_rollups',
+              'book_categories', 'book_tags')
+    with engine.connect() as conn:
+        return {name: conn.execute(select(func.count()).select_from(db.Model.metadata.tables[name])).scalar()
+                for name in tables}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', required=True, help='SQLite file to create.')
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--lendings', type=int, default=1000000)
+    parser.add_argument('--reading-list', type=int, default=50000)
+    parser.add_argument('--request-logs', type=int, default=5000000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-rollups', action='store_true',
+                        help='Leave the request logs uncompacted (the slowest step).')
+    parser.add_argument('--force', action='store_true', help='Replace the output file if it exists.')
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        if not args.force:
+            sys.exit(f"❌ {args.output} already exists, pass --force to replace it")
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(args.output + suffix):
+                os.remove(args.output + suffix)
+
+    engine = create_engine(f'sqlite:///{os.path.abspath(args.output)}')
+    # No concurrent readers while generating, so skip the per-commit sync
+    configure_engine(engine, 'wal', {'synchronous': 'OFF'})
+    start = time.perf_counter()
+    print(f"Generating {args.output} (seed {args.seed})")
+    try:
+        counts = generate(engine, args.books, args.lendings, args.reading_list, args.request_logs,
+                          seed=args.seed, rollups=not args.no_rollups)
+    finally:
+        engine.dispose()
+    for name, count in counts.items():
+        print(f"  {name}: {count}")
+    print(f"✅ Done in {time.perf_counter() - start:.0f}s, {os.path.getsize(args.output) / 2 ** 20:.0f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Import-time budget for `import app` and `create_app()`.
+
+Each measurement runs in a fresh interpreter, since imports are cached per process.
+Exits non-zero if either step goes over its budget, or if building the app pulls in a
+module that's meant to be loaded on first use. Run from the repository root:
+
+    python benchmarks/import_time.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds, median over the runs
+IMPORT_BUDGET = 0.8
+CREATE_APP_BUDGET = 0.25
+
+# Only loaded when a request or command needs them: ISBN lookups, the scheduler, the admin panel
+DEFERRED_MODULES = ('requests', 'isbnlib', 'apscheduler', 'humanize', 'main', 'query_plans')
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({"import": imported - start, "create_app": created - imported,
+                  "modules": sorted(name for name in sys.modules if "." not in name)}))
+'''
+
+
+def measure():
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET)
+    parser.add_argument('--create-app-budget', type=float, default=CREATE_APP_BUDGET)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    import_time = statistics.median(run['import'] for run in runs)
+    create_time = statistics.median(run['create_app'] for run in runs)
+    loaded = sorted(set(DEFERRED_MODULES) & set(runs[-1]['modules']))
+
+    failures = []
+    print(f"import app:   {import_time * 1000:7.1f}ms (budget {args.import_budget * 1000:.0f}ms)")
+    print(f"create_app(): {create_time * 1000:7.1f}ms (budget {args.create_app_budget * 1000:.0f}ms)")
+    if import_time > args.import_budget:
+        failures.append('import app is over budget')
+    if create_time > args.create_app_budget:
+        failures.append('create_app() is over budget')
+    if loaded:
+        failures.append(f"create_app() imported deferred modules: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Within budget")
+
+
+if __name__ == '__main__':
+    main()
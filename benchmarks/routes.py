@@ -0,0 +1,401 @@
+"""Per-route latency, query count and peak memory, saved as a baseline and compared between runs.
+
+Works on a scratch copy of the database (several routes write), builds the app against
+it and drives every route through the Flask test client. Routes that only call the ISBN
+APIs are listed as skipped rather than timed. Each route's peak Python memory comes from
+one extra traced request, since tracemalloc slows down the timed ones. Run from the
+repository root:
+
+    python benchmarks/generate_library.py --output /tmp/large.db
+    python benchmarks/routes.py /tmp/large.db --output baseline.json
+    python benchmarks/routes.py /tmp/large.db --compare baseline.json
+
+--compare exits non-zero when a route got slower, ran more queries or used more memory
+than the thresholds allow.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text  # noqa: E402
+
+from app import create_app, prepare_database  # noqa: E402
+from models import db  # noqa: E402
+from generate_library import row_counts  # noqa: E402
+
+# Rows a route can be pointed at: (table, condition). Each request gets ids no earlier
+# request has used, so a route that changes a row never sees one already changed.
+FIXTURES = {
+    'book': ('books', 'deleted = 0 AND is_lent = 0'),
+    'lent_book': ('books', 'deleted = 0 AND is_lent = 1'),
+    'deleted_book': ('books', 'deleted = 1'),
+    'open_lending': ('book_lending', 'deleted = 0 AND return_date IS NULL'),
+    'lending': ('book_lending', 'deleted = 0 AND return_date IS NOT NULL'),
+    'deleted_lending': ('book_lending', 'deleted = 1 AND return_date IS NOT NULL'),
+    'item': ('reading_list_item', 'completed = 0'),
+    'other_item': ('reading_list_item', 'completed = 0'),
+    'completed_item': ('reading_list_item', 'completed = 1'),
+}
+# Looked up fresh for every request rather than handed out once
+SHARED_FIXTURES = {
+    'backup': ('database_backups', '1 = 1'),
+}
+
+# `body` turns the fixture ids into test client arguments. `runs` pins the number of
+# requests for the slow whole-library routes, which also skip the warmup.
+Scenario = namedtuple('Scenario', 'name method path needs body runs', defaults=((), None, None))
+
+
+def _form(**data):
+    return lambda f: {'data': {key: str(value).format(**f) for key, value in data.items()}}
+
+
+def _import_file(f):
+    lines = [json.dumps({'type': 'header', 'version': 1})]
+    lines += [json.dumps({'type': 'book', 'title': f'Imported {i}', 'author': 'Benchmark', 'copy_number': 1,
+                          'categories': 'Fiction', 'tags': '', 'deleted': False, 'read': False})
+              for i in range(100)]
+    return {'data': {'file': (io.BytesIO('\n'.join(lines).encode()), 'library.jsonl')}}
+
+
+TODAY = date.today()
+
+SCENARIOS = [
+    # Catalog
+    Scenario('index', 'GET', '/'),
+    Scenario('index_search_title', 'GET', '/?search=river&search_by=title'),
+    Scenario('index_search_all', 'GET', '/?search=silent+garden&search_by=all'),
+    Scenario('index_category', 'GET', '/?search=Poetry&search_by=categories'),
+    Scenario('index_no_category', 'GET', '/?search=none&search_by=categories'),
+    Scenario('index_read', 'GET', '/?search=read&search_by=read'),
+    Scenario('index_dates', 'GET', f'/?date_from={TODAY.year - 3}-01-01&date_to={TODAY.year - 2}-12-31'),
+    Scenario('suggest', 'GET', '/api/books/suggest?q=silent'),
+    Scenario('suggest_exclude_reading_list', 'GET', '/api/books/suggest?q=ri&exclude=reading_list'),
+    Scenario('add_book_form', 'GET', '/add_book'),
+    Scenario('bulk_import_form', 'GET', '/bulk_import'),
+    Scenario('edit_book_form', 'GET', '/edit_book/{book}', ('book',)),
+    Scenario('debug_book', 'GET', '/debug_book/{book}', ('book',)),
+    Scenario('test', 'GET', '/test'),
+    # Lending
+    Scenario('book_lending_history', 'GET', '/book/{lent_book}/lending', ('lent_book',)),
+    Scenario('currently_lent', 'GET', '/currently-lent'),
+    Scenario('lending_history', 'GET', '/lending_history'),
+    Scenario('lending_history_out', 'GET', '/lending_history?status=out'),
+    Scenario('lending_history_borrower', 'GET', '/lending_history?borrower=Ada'),
+    # Reading list and dashboards
+    Scenario('reading_list', 'GET', '/reading_list'),
+    Scenario('reading_list_all_years', 'GET', '/reading_list?year=all'),
+    Scenario('metrics', 'GET', '/metrics'),
+    Scenario('prometheus', 'GET', '/metrics/prometheus'),
+    # Admin reads
+    Scenario('admin', 'GET', '/admin'),
+    Scenario('admin_errors', 'GET', '/admin?status=5xx'),
+    Scenario('admin_trash_search', 'GET', '/admin?trash_search=river'),
+    Scenario('isbn_cache_stats', 'GET', '/admin/isbn_cache/stats'),
+    Scenario('request_log_stats', 'GET', '/admin/request_log/stats'),
+    Scenario('response_cache_stats', 'GET', '/admin/response_cache/stats'),
+    Scenario('logs_export_day', 'GET', f'/admin/logs/export?date_from={TODAY - timedelta(days=1)}', runs=3),
+    Scenario('library_export', 'GET', '/admin/export', runs=1),
+    # Writes
+    Scenario('add_book', 'POST', '/add_book', body=_form(
+        title='Benchmark Book', author='Benchmark Author', isbn='', publication_date='2024', pages=300,
+        categories='Fiction, History', tags='benchmark')),
+    Scenario('edit_book', 'POST', '/edit_book/{book}', ('book',), _form(
+        title='Edited Title', author='Edited Author', isbn='9780000000002', publication_date='2001', pages=250,
+        chapters=12, categories='History', tags='edited')),
+    Scenario('mark_book_read', 'POST', '/mark_book_read/{book}', ('book',)),
+    Scenario('lend_book', 'POST', '/book/{book}/lending', ('book',), _form(
+        borrower_name='Benchmark Borrower', lent_date=str(TODAY), due_date=str(TODAY + timedelta(days=14)))),
+    Scenario('return_lending', 'POST', '/lending/{open_lending}/return', ('open_lending',)),
+    Scenario('delete_lending', 'GET', '/lending/{lending}/delete', ('lending',)),
+    Scenario('restore_lending', 'POST', '/admin/trash/lending/{deleted_lending}/restore', ('deleted_lending',)),
+    Scenario('permanent_delete_lending', 'POST', '/lending/{deleted_lending}/permanent_delete',
+             ('deleted_lending',)),
+    Scenario('delete_book', 'GET', '/book/{book}/delete', ('book',)),
+    Scenario('restore_book', 'POST', '/admin/trash/book/{deleted_book}/restore', ('deleted_book',)),
+    Scenario('permanent_delete_book', 'POST', '/book/{deleted_book}/permanent_delete', ('deleted_book',)),
+    Scenario('reading_list_add', 'POST', '/reading_list/add/{book}', ('book',)),
+    Scenario('reading_list_add_with_date', 'POST', '/reading_list/add_with_date', ('book',), _form(
+        book_id='{book}', year=TODAY.year, month=TODAY.month, day=1)),
+    Scenario('reading_list_reorder', 'POST', '/reading_list/reorder', ('item', 'other_item'),
+             lambda f: {'json': {'moves': [{'id': f['item'], 'after_id': f['other_item']}]}}),
+    Scenario('reading_list_edit_date', 'POST', '/reading_list/edit_date', ('item',), _form(
+        item_id='{item}', year=TODAY.year - 1, month=6, day=15)),
+    Scenario('reading_list_complete', 'POST', '/reading_list/complete/{item}', ('item',)),
+    Scenario('reading_list_edit_read_date', 'POST', '/reading_list/edit_read_date', ('completed_item',), _form(
+        item_id='{completed_item}', year=TODAY.year, month=TODAY.month, day=1)),
+    Scenario('reading_list_unmark', 'POST', '/reading_list/unmark/{completed_item}', ('completed_item',)),
+    Scenario('reading_list_remove', 'POST', '/reading_list/remove/{item}', ('item',)),
+    Scenario('clear_isbn_cache', 'POST', '/admin/isbn_cache/clear'),
+    Scenario('clear_response_cache', 'POST', '/admin/response_cache/clear'),
+    Scenario('schedule_backup', 'POST', '/admin/schedule', body=_form(schedule_type='daily', hour=3, minute=0)),
+    Scenario('remove_schedule', 'POST', '/admin/schedule/remove'),
+    Scenario('library_import', 'POST', '/admin/import', body=_import_file),
+    # Whole-library maintenance
+    Scenario('fix_copy_numbers', 'POST', '/admin/fix-copy-numbers', runs=1),
+    Scenario('create_backup', 'POST', '/admin/backup', body=_form(notes='benchmark'), runs=1),
+    Scenario('download_backup', 'GET', '/admin/backup/download/{backup}', ('backup',), runs=1),
+    Scenario('restore_backup', 'POST', '/admin/backup/{backup}/restore', ('backup',), runs=1),
+    Scenario('delete_backup', 'POST', '/admin/backup/{backup}/delete', ('backup',), runs=1),
+    Scenario('cleanup_backups', 'POST', '/admin/backup/cleanup', runs=1),
+]
+
+# (endpoint, method) pairs deliberately left out, and why
+SKIPPED = {
+    ('library.add_book', 'POST'): 'ISBN entry calls the ISBN APIs (manual entry is timed as add_book)',
+    ('library.lookup_isbn', 'GET'): 'calls the ISBN APIs',
+    ('library.search_books', 'GET'): 'calls the ISBN APIs',
+    ('library.search_title', 'POST'): 'calls the ISBN APIs',
+    ('library.search_combined', 'POST'): 'calls the ISBN APIs',
+    ('library.bulk_import', 'POST'): 'starts an import that calls the ISBN APIs',
+    ('library.bulk_import_job', 'GET'): 'needs a running bulk import',
+    ('library.bulk_import_status', 'GET'): 'needs a running bulk import',
+    ('static', 'GET'): 'static files',
+}
+
+
+class Fixtures:
+    def __init__(self, engine):
+        self.engine = engine
+        self.used = {}
+
+    def take(self, names):
+        """Ids for one request, or None once a fixture has run out of rows"""
+        ids = {}
+        for name in names:
+            if name in SHARED_FIXTURES:
+                table, condition = SHARED_FIXTURES[name]
+                used = set()
+            else:
+                table, condition = FIXTURES[name]
+                used = self.used.setdefault(table, set())
+            with self.engine.connect() as conn:
+                # A fixed shuffle, so every run picks the same rows from the same database
+                candidates = conn.execute(text(
+                    f"SELECT id FROM {table} WHERE {condition} "
+                    f"ORDER BY (id * 2654435761) % 4294967296 LIMIT :limit"
+                ), {'limit': len(used) + 1}).scalars().all()
+            fresh = [row_id for row_id in candidates if row_id not in used]
+            if not fresh:
+                return None
+            used.add(fresh[0])
+            ids[name] = fresh[0]
+        return ids
+
+
+class QueryCounter:
+    """Counts the statements the benchmark's own thread runs, ignoring background writers"""
+
+    def __init__(self, engine):
+        self.count = 0
+        self.thread = threading.get_ident()
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, *args):
+        if threading.get_ident() == self.thread:
+            self.count += 1
+
+
+def _percentile(samples, pct):
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100)[pct - 1]
+
+
+def coverage(app):
+    """Routes (endpoint, method) with neither a scenario nor a reason to skip them"""
+    adapter = app.url_map.bind('localhost')
+    covered = set()
+    for scenario in SCENARIOS:
+        path = scenario.path.split('?')[0].format(**{name: 1 for name in scenario.needs})
+        covered.add((adapter.match(path, method=scenario.method)[0], scenario.method))
+    routes = {(rule.endpoint, method) for rule in app.url_map.iter_rules()
+              for method in rule.methods - {'HEAD', 'OPTIONS'}}
+    return sorted(routes - covered - set(SKIPPED))
+
+
+def request(client, scenario, ids):
+    path = scenario.path.format(**ids)
+    kwargs = scenario.body(ids) if scenario.body else {}
+    response = client.open(path, method=scenario.method, **kwargs)
+    # Streamed responses (exports, backup downloads) only do their work as they're read;
+    # read them a chunk at a time so the body isn't counted towards the route's memory
+    for _ in response.iter_encoded():
+        pass
+    response.close()
+    return response.status_code
+
+
+def run_scenario(client, fixtures, counter, scenario, runs, warmup):
+    if scenario.runs:
+        runs, warmup = scenario.runs, 0
+    timings, queries, statuses = [], [], Counter()
+    peak = 0
+    for i in range(warmup + runs + 1):
+        ids = fixtures.take(scenario.needs)
+        if ids is None:
+            return None
+        traced = i == warmup + runs
+        if traced:
+            tracemalloc.start()
+        counter.count = 0
+        start = time.perf_counter()
+        status = request(client, scenario, ids)
+        elapsed = time.perf_counter() - start
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        elif i >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(counter.count)
+            statuses[status] += 1
+    return {
+        'method': scenario.method,
+        'path': scenario.path,
+        'runs': len(timings),
+        'p50_ms': _percentile(timings, 50),
+        'p95_ms': _percentile(timings, 95),
+        'p99_ms': _percentile(timings, 99),
+        'mean_ms': statistics.mean(timings),
+        'max_ms': max(timings),
+        'queries': statistics.median(queries),
+        'peak_kib': peak / 1024,
+        'errors': sum(count for status, count in statuses.items() if status >= 500),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def benchmark(database, runs, warmup, only=None, response_cache=False, in_place=False):
+    workdir = tempfile.mkdtemp(prefix='route-bench-')
+    path = os.path.abspath(database)
+    if not in_place:
+        path = os.path.join(workdir, 'library.db')
+        for suffix in ('', '-wal'):
+            if os.path.exists(database + suffix):
+                shutil.copyfile(database + suffix, path + suffix)
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'BACKUP_FOLDER': os.path.join(workdir, 'backups'),
+        'ISBN_CACHE_PATH': os.path.join(workdir, 'isbn_cache.db'),
+        # Keep request logs out of the timings; errors are still logged
+        'REQUEST_LOG_SAMPLE_RATE': 0.0,
+        # Off by default so repeated requests measure the views rather than cache hits
+        **({} if response_cache else {'RESPONSE_CACHE_MAX_BYTES': 0}),
+    })
+    try:
+        prepare_database(app)
+        with app.app_context():
+            engine = db.engine
+            rows = row_counts(engine)
+            fixtures = Fixtures(engine)
+            counter = QueryCounter(engine)
+            missing = coverage(app)
+        # No cookies, so the flash messages from writes don't pile up in the session
+        client = app.test_client(use_cookies=False)
+        results = {}
+        for scenario in SCENARIOS:
+            if only and not any(name in scenario.name for name in only):
+                continue
+            result = run_scenario(client, fixtures, counter, scenario, runs, warmup)
+            if result is None:
+                print(f"  {scenario.name}: skipped, no rows left for {', '.join(scenario.needs)}")
+                continue
+            results[scenario.name] = result
+            flag = ' ❌' if result['errors'] else ''
+            print(f"  {scenario.name:<32} p50 {result['p50_ms']:9.2f}ms  p95 {result['p95_ms']:9.2f}ms  "
+                  f"{result['queries']:6.0f} queries  {result['peak_kib']:9.0f} KiB{flag}")
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        built = app.extensions['personal_library'].built('request_log_writer')
+        if built:
+            built.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for endpoint, method in missing:
+        print(f"⚠️  No scenario for {method} {endpoint}")
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'database': os.path.abspath(database),
+        'rows': rows,
+        'settings': {'runs': runs, 'warmup': warmup, 'response_cache': response_cache},
+        'skipped': {f'{method} {endpoint}': reason for (endpoint, method), reason in SKIPPED.items()},
+        'routes': results,
+    }
+
+
+def compare(baseline, current, latency_threshold, min_ms, memory_threshold):
+    """Lines describing each regression from `baseline` to `current`"""
+    regressions = []
+    if baseline.get('rows') != current.get('rows'):
+        print(f"⚠️  Row counts differ from the baseline's database: {baseline.get('rows')} vs {current['rows']}")
+    for name, now in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        slower = now['p95_ms'] - before['p95_ms']
+        if now['p95_ms'] > before['p95_ms'] * (1 + latency_threshold) and slower > min_ms:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {now['p95_ms']:.2f}ms")
+        if now['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']:.0f} -> {now['queries']:.0f} queries per request")
+        if now['peak_kib'] > before['peak_kib'] * (1 + memory_threshold) and now['peak_kib'] - before['peak_kib'] > 256:
+            regressions.append(f"{name}: peak memory {before['peak_kib']:.0f} -> {now['peak_kib']:.0f} KiB")
+        if now['errors'] > before['errors']:
+            regressions.append(f"{name}: {now['errors']} server errors, baseline had {before['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='SQLite library to benchmark, e.g. from generate_library.py.')
+    parser.add_argument('--runs', type=int, default=20, help='Timed requests per route.')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per route first.')
+    parser.add_argument('--routes', nargs='+', help='Only scenarios whose name contains one of these.')
+    parser.add_argument('--output', help='Write the results here as JSON.')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier --output to check against.')
+    parser.add_argument('--latency-threshold', type=float, default=0.2,
+                        help='Allowed p95 slowdown as a fraction of the baseline.')
+    parser.add_argument('--min-ms', type=float, default=2.0,
+                        help='Ignore p95 slowdowns smaller than this, however large the fraction.')
+    parser.add_argument('--memory-threshold', type=float, default=0.25,
+                        help='Allowed peak memory growth as a fraction of the baseline.')
+    parser.add_argument('--response-cache', action='store_true', help='Leave the response cache on.')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Run against the database itself instead of a copy (it will be modified).')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        sys.exit(f"❌ {args.database} not found, create one with benchmarks/generate_library.py")
+    print(f"Benchmarking {args.database}: {args.runs} runs per route after {args.warmup} warmup")
+    results = benchmark(args.database, args.runs, args.warmup, args.routes, args.response_cache, args.in_place)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.latency_threshold, args.min_ms, args.memory_threshold)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Mixed read/write throughput under each SQLite pragma profile.
+
+Each profile gets a fresh seeded database. N worker threads then run for a fixed time,
+each doing catalog page reads and, at --write-ratio, single-row request log commits
+(the app's steady background write). Run from the repository root:
+
+    python benchmarks/sqlite_profiles.py --workers 1 4 8 --seconds 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.pool import QueuePool  # noqa: E402
+
+from models import Book, RequestLog  # noqa: E402
+from query_plans import seed  # noqa: E402
+from sqlite_profile import PROFILES, configure_engine  # noqa: E402
+
+books = Book.__table__
+logs = RequestLog.__table__
+
+
+def read(conn, rng, pages):
+    # The catalog's first query: a page of active books by title, plus the count
+    offset = rng.randrange(pages) * 10
+    conn.execute(select(books.c.id, books.c.title, books.c.author)
+                 .where(books.c.deleted == False).order_by(books.c.title, books.c.id)
+                 .limit(10).offset(offset)).all()
+    conn.execute(select(func.count()).select_from(books).where(books.c.deleted == False)).scalar()
+
+
+def write(conn, rng):
+    conn.execute(insert(logs).values(
+        method='GET', path='/', endpoint='index', status_code=200, ip_address='127.0.0.1',
+        user_agent='benchmark', response_time=rng.random() / 100))
+
+
+def worker(engine, deadline, write_ratio, seed_value, pages, results):
+    rng = random.Random(seed_value)
+    reads, writes, errors = [], [], 0
+    while time.monotonic() < deadline:
+        is_write = rng.random() < write_ratio
+        start = time.perf_counter()
+        try:
+            if is_write:
+                with engine.begin() as conn:
+                    write(conn, rng)
+            else:
+                with engine.connect() as conn:
+                    read(conn, rng, pages)
+        except OperationalError:
+            # "database is locked" once busy_timeout runs out
+            errors += 1
+            continue
+        (writes if is_write else reads).append(time.perf_counter() - start)
+    results.append((reads, writes, errors))
+
+
+def run(profile, workers, seconds, write_ratio, book_count):
+    fd, path = tempfile.mkstemp(suffix='.db', prefix=f'bench-{profile}-')
+    os.close(fd)
+    # Pooled like the app's engine, so pragmas and page cache persist per connection
+    engine = create_engine(f'sqlite:///{path}', poolclass=QueuePool, pool_size=workers, max_overflow=0,
+                           connect_args={'check_same_thread': False})
+    try:
+        configure_engine(engine, profile)
+        seed(engine, books=book_count, lendings=book_count, logs=book_count)
+        pages = max(1, book_count // 10 - 1)
+        results = []
+        deadline = time.monotonic() + seconds
+        threads = [threading.Thread(target=worker, args=(engine, deadline, write_ratio, i, pages, results))
+                   for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    reads = [t for r, _, _ in results for t in r]
+    writes = [t for _, w, _ in results for t in w]
+    return {
+        'reads_per_sec': len(reads) / seconds,
+        'writes_per_sec': len(writes) / seconds,
+        'read_p50_ms': _percentile(reads, 50),
+        'read_p95_ms': _percentile(reads, 95),
+        'write_p95_ms': _percentile(writes, 95),
+        'errors': sum(e for _, _, e in results),
+    }
+
+
+def _percentile(samples, pct):
+    if len(samples) < 2:
+        return samples[0] * 1000 if samples else 0.0
+    return statistics.quantiles(samples, n=100)[pct - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4, 8])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of operations that are writes.')
+    parser.add_argument('--books', type=int, default=5000, help='Books seeded into each database.')
+    args = parser.parse_args()
+
+    print(f"{'profile':<10} {'workers':>7} {'reads/s':>9} {'writes/s':>9} "
+          f"{'read p50':>9} {'read p95':>9} {'write p95':>10} {'errors':>7}")
+    for profile in args.profiles:
+        for workers in args.workers:
+            r = run(profile, workers, args.seconds, args.write_ratio, args.books)
+            print(f"{profile:<10} {workers:>7} {r['reads_per_sec']:>9.0f} {r['writes_per_sec']:>9.0f} "
+                  f"{r['read_p50_ms']:>7.2f}ms {r['read_p95_ms']:>7.2f}ms {r['write_p95_ms']:>8.2f}ms {r['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import func
+
+from models import db, Book
+from isbn_cache import normalize_isbn
+from http_client import RateLimiter
+
+# Separators accepted between ISBNs in a pasted list or uploaded CSV/TXT file
+ISBN_SEPARATORS = re.compile(r'[\s,;]+')
+
+
+def parse_isbn_list(text):
+    """Pull ISBN-10/13 values out of pasted text or an uploaded file.
+
+    Returns (isbns, invalid). Repeated ISBNs are kept since each line is one
+    physical copy; tokens without any digits (CSV headers etc.) are ignored.
+    """
+    isbns, invalid = [], []
+    for token in ISBN_SEPARATORS.split(text or ''):
+        if not any(c.isdigit() for c in token):
+            continue
+        isbn = normalize_isbn(token)
+        if len(isbn) in (10, 13):
+            isbns.append(isbn)
+        else:
+            invalid.append(token)
+    return isbns, invalid
+
+
+@dataclass
+class BulkImportJob:
+    id: str
+    total: int
+    tags: str = ''
+    status: str = 'queued'
+    processed: int = 0
+    added: int = 0
+    not_found: List[str] = field(default_factory=list)
+    invalid: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+
+    def to_dict(self):
+        data = asdict(self)
+        data['progress'] = self.processed / self.total if self.total else 1.0
+        data['elapsed'] = (self.finished_at or time.time()) - self.created_at
+        return data
+
+
+class BulkImporter:
+    """Runs ISBN imports in a background thread and keeps their progress in memory.
+
+    ISBNs are handled `batch_size` at a time: looked up in bulk through
+    LibraryManager.get_book_data_by_isbns, then inserted as `Book` rows in a
+    single transaction with copy numbers continuing from what is already shelved.
+    """
+
+    def __init__(self, app, library, batch_size=200, lookup_batch_size=50,
+                 google_rate=5, google_workers=4, max_jobs=20):
+        self.app = app
+        self.library = library
+        self.batch_size = batch_size
+        self.lookup_batch_size = lookup_batch_size
+        self.max_jobs = max_jobs
+        self.rate_limiter = RateLimiter(google_rate, burst=google_workers)
+        # Own pool so a large import doesn't starve the interactive lookups
+        self.executor = ThreadPoolExecutor(max_workers=google_workers, thread_name_prefix='bulk-import')
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, isbns, invalid=None, tags=''):
+        job = BulkImportJob(id=uuid.uuid4().hex[:12], total=len(isbns), tags=tags, invalid=list(invalid or []))
+        with self._lock:
+            self.jobs[job.id] = job
+            # Forget the oldest finished jobs
+            finished = [j for j in self.jobs.values() if j.finished_at]
+            for old in sorted(finished, key=lambda j: j.created_at)[:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[old.id]
+
+        thread = threading.Thread(target=self._run, args=(job, isbns), name=f'bulk-import-{job.id}', daemon=True)
+        thread.start()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _run(self, job, isbns):
+        job.status = 'running'
+        with self.app.app_context():
+            try:
+                for i in range(0, len(isbns), self.batch_size):
+                    chunk = isbns[i:i + self.batch_size]
+                    book_data = self.library.get_book_data_by_isbns(
+                        chunk,
+                        rate_limiter=self.rate_limiter,
+                        executor=self.executor,
+                        batch_size=self.lookup_batch_size
+                    )
+                    self._insert_books(job, chunk, book_data)
+                    job.processed += len(chunk)
+                job.status = 'done'
+            except Exception as e:
+                db.session.rollback()
+                job.status = 'failed'
+                job.errors.append(str(e))
+                print(f"Bulk import {job.id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                db.session.remove()
+
+    def _insert_books(self, job, chunk, book_data):
+        found = [isbn for isbn in chunk if book_data.get(isbn)]
+        job.not_found.extend(isbn for isbn in chunk if not book_data.get(isbn))
+        if not found:
+            return
+
+        # Highest copy number already on the shelf for each ISBN, in one query
+        last_copy = dict(db.session.query(
+            Book.isbn, func.max(Book.copy_number)
+        ).filter(
+            Book.isbn.in_(set(found)),
+            Book.deleted == False
+        ).group_by(Book.isbn).all())
+
+        today = datetime.now().date()
+        books = []
+        for isbn in found:
+            data = book_data[isbn]
+            last_copy[isbn] = (last_copy.get(isbn) or 0) + 1
+
+            categories = data.get('categories', '')
+            if isinstance(categories, list):
+                categories = ', '.join(categories)
+
+            books.append(Book(
+                title=data['title'],
+                author=data['author'] or '',
+                isbn=isbn,
+                copy_number=last_copy[isbn],
+                publication_date=data.get('publication_date'),
+                pages=data.get('pages'),
+                acquisition_date=today,
+                categories=categories,
+                tags=job.tags,
+            ))
+
+        try:
+            db.session.add_all(books)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        job.added += len(books)
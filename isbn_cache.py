@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Provider keys stored in the cache alongside the merged record
+GOOGLE = 'google'
+OPENLIBRARY = 'openlibrary'
+MERGED = 'merged'
+
+
+def normalize_isbn(isbn):
+    """Strip hyphens and spaces so '978-0-00...' and '97800...' share a cache entry"""
+    if not isbn:
+        return ''
+    return ''.join(c for c in str(isbn) if c.isdigit() or c in 'xX').upper()
+
+
+class IsbnCache:
+    """SQLite-backed cache of ISBN metadata lookups.
+
+    Each ISBN can hold one payload per provider plus the merged record. A payload
+    of None is a negative result ("provider has nothing for this ISBN") and is kept
+    for `negative_ttl` seconds instead of `ttl`. Once the cache holds more than
+    `max_entries` rows the least recently used ones are evicted.
+    """
+
+    def __init__(self, path, ttl=30 * 24 * 3600, negative_ttl=24 * 3600, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'expired': 0, 'writes': 0, 'evictions': 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS isbn_cache (
+                isbn TEXT NOT NULL,
+                source TEXT NOT NULL,
+                payload TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (isbn, source)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_isbn_cache_accessed_at ON isbn_cache (accessed_at)')
+        conn.commit()
+
+    def _connect(self):
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def get(self, isbn, source):
+        """Return (found, payload). A found entry with a None payload is a cached negative result."""
+        key = normalize_isbn(isbn)
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT payload, expires_at FROM isbn_cache WHERE isbn = ? AND source = ?',
+                (key, source)
+            ).fetchone()
+
+            if row is None:
+                self._count('misses')
+                return False, None
+
+            payload, expires_at = row
+            if expires_at <= now:
+                conn.execute('DELETE FROM isbn_cache WHERE isbn = ? AND source = ?', (key, source))
+                conn.commit()
+                self._count('misses')
+                self._count('expired')
+                return False, None
+
+            conn.execute(
+                'UPDATE isbn_cache SET accessed_at = ? WHERE isbn = ? AND source = ?',
+                (now, key, source)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error reading ISBN cache: {e}")
+            self._count('misses')
+            return False, None
+
+        self._count('hits')
+        if payload is None:
+            self._count('negative_hits')
+            return True, None
+        return True, json.loads(payload)
+
+    def set(self, isbn, source, payload):
+        """Store a provider (or merged) payload; None records a negative result"""
+        key = normalize_isbn(isbn)
+        if not key:
+            return
+        now = time.time()
+        ttl = self.ttl if payload is not None else self.negative_ttl
+        try:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO isbn_cache (isbn, source, payload, created_at, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, source, json.dumps(payload) if payload is not None else None, now, now + ttl, now)
+            )
+            evicted = self._evict(conn)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing ISBN cache: {e}")
+            return
+
+        self._count('writes')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def _evict(self, conn):
+        """Drop least recently used rows beyond max_entries"""
+        if not self.max_entries:
+            return 0
+        overflow = conn.execute('SELECT COUNT(*) FROM isbn_cache').fetchone()[0] - self.max_entries
+        if overflow <= 0:
+            return 0
+        conn.execute(
+            'DELETE FROM isbn_cache WHERE rowid IN '
+            '(SELECT rowid FROM isbn_cache ORDER BY accessed_at LIMIT ?)',
+            (overflow,)
+        )
+        return overflow
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM isbn_cache')
+        conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        try:
+            stats['entries'] = self._connect().execute('SELECT COUNT(*) FROM isbn_cache').fetchone()[0]
+        except sqlite3.Error:
+            stats['entries'] = None
+        stats['max_entries'] = self.max_entries
+        return stats
@@ -0,0 +1,161 @@
+import base64
+import binascii
+import json
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import date, datetime
+
+from sqlalchemy import event, func, tuple_
+from sqlalchemy.orm import Session
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        raise ValueError('unknown cursor value')
+    return value
+
+
+def encode_cursor(values, direction='next'):
+    """Opaque URL-safe token for "the page after/before the row with these sort key values" """
+    payload = json.dumps({'k': [_encode_value(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, values); a missing or mangled cursor means the first page"""
+    if not cursor:
+        return 'next', None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        direction = 'prev' if payload['d'] == 'prev' else 'next'
+        return direction, [_decode_value(v) for v in payload['k']]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return 'next', None
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None, total_is_estimate=False):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=10, descending=False):
+    """Seek pagination over `query` ordered by `keys` (the last key must be unique, e.g. the id).
+
+    Instead of OFFSET, each page continues from the sort key of the previous page's
+    last (or first) row, so any page costs the same index range scan as the first.
+    """
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(keys):
+        direction, values = 'next', None
+    backwards = direction == 'prev'
+    ascending = descending == backwards
+
+    labels = [f'_keyset_{i}' for i in range(len(keys))]
+    q = query.add_columns(*[key.label(label) for key, label in zip(keys, labels)])
+    if values is not None:
+        position = tuple_(*keys)
+        q = q.filter(position > tuple_(*values) if ascending else position < tuple_(*values))
+    q = q.order_by(None).order_by(*[key.asc() if ascending else key.desc() for key in keys])
+
+    rows = q.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return KeysetPage([])
+
+    first = [getattr(rows[0], label) for label in labels]
+    last = [getattr(rows[-1], label) for label in labels]
+    has_next = values is not None if backwards else more
+    has_prev = more if backwards else values is not None
+    return KeysetPage(
+        [row[0] for row in rows],
+        next_cursor=encode_cursor(last, 'next') if has_next else None,
+        prev_cursor=encode_cursor(first, 'prev') if has_prev else None,
+    )
+
+
+class CountCache:
+    """Row counts for paginated lists, kept for `ttl` seconds or until a flush touches their tables.
+
+    Writes that bypass the session (core inserts) only expire entries through the TTL.
+    """
+
+    def __init__(self, ttl=60, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _count_caches.add(self)
+
+    def get(self, key, tables, count):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[2]
+        value = count()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, frozenset(tables), value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, tables):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[1] & tables]:
+                del self._entries[key]
+
+
+# Every live CountCache, expired by the one flush listener below rather than one per cache,
+# which would pile up with each app built in the process
+_count_caches = weakref.WeakSet()
+
+
+@event.listens_for(Session, 'after_flush')
+def _expire_counts(session, flush_context):
+    tables = {obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+              if hasattr(obj, '__table__')}
+    if tables:
+        for cache in list(_count_caches):
+            cache.invalidate(tables)
+
+
+def estimate_rows(session, id_column):
+    """Approximate row count from the primary key range, two index lookups instead of a count"""
+    # Separate queries: SQLite only answers a lone min() or max() straight from the index
+    low = session.query(func.min(id_column)).scalar()
+    high = session.query(func.max(id_column)).scalar()
+    return 0 if low is None else high - low + 1
@@ -0,0 +1,216 @@
+import gzip
+import io
+import json
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, func, insert, select, update
+from sqlalchemy.exc import DBAPIError
+
+from models import Book, BookLending, ReadingListItem
+from taxonomy import sync_taxonomy_rows
+
+TRANSFER_VERSION = 1
+TRANSFER_BATCH_SIZE = 2000
+
+books = Book.__table__
+lendings = BookLending.__table__
+reading_items = ReadingListItem.__table__
+
+# Line type -> (table, columns carried over). The lending pointer on books is rebuilt on
+# import rather than copied, since lending ids change
+TABLES = {
+    'book': (books, [c for c in books.c if c.name not in ('current_lending_id', 'is_lent')]),
+    'lending': (lendings, list(lendings.c)),
+    'reading_list_item': (reading_items, list(reading_items.c)),
+}
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def export_library(engine, batch_size=TRANSFER_BATCH_SIZE):
+    """Yield the library as JSON Lines: a header, then books, lendings and reading list items.
+
+    Each table is read in id order a batch per connection, so memory stays flat.
+    """
+    yield json.dumps({'type': 'header', 'version': TRANSFER_VERSION,
+                      'exported_at': datetime.utcnow().isoformat()}) + '\n'
+    for kind, (table, columns) in TABLES.items():
+        last_id = 0
+        while True:
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    select(*columns).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+                ).all()
+            if not rows:
+                break
+            yield ''.join(json.dumps({'type': kind, **row._mapping}, default=_json_default) + '\n'
+                          for row in rows)
+            last_id = rows[-1].id
+
+
+def open_lines(stream):
+    """Text lines from an uploaded or opened binary stream, gunzipping it if needed"""
+    stream = io.BufferedReader(stream) if not hasattr(stream, 'peek') else stream
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def _parse(columns, record):
+    row = {}
+    for column in columns:
+        if column.name == 'id' or column.name not in record:
+            continue
+        value = record[column.name]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, Date):
+            value = date.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+
+class LibraryImport:
+    """Streams JSON Lines records into the database, batch by batch inside one transaction.
+
+    Each batch is a bulk insert under its own savepoint; if it fails, the batch is retried a
+    row at a time so only the bad rows are skipped. Book ids are remapped to the ids they get
+    here, and lendings/reading list items follow their book.
+    """
+
+    def __init__(self, conn, batch_size=TRANSFER_BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.book_ids = {}
+        self.counts = {kind: 0 for kind in TABLES}
+        self.skipped = {kind: 0 for kind in TABLES}
+        self.unreadable = 0
+        self.errors = []
+        self.first_book_id = None
+        self.order_offset = conn.execute(select(func.coalesce(func.max(reading_items.c.order), 0))).scalar()
+
+    def run(self, lines):
+        pending, kind = [], None
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.unreadable += 1
+                self._error(f'line {number}: not valid JSON')
+                continue
+            if not isinstance(record, dict):
+                self.unreadable += 1
+                self._error(f'line {number}: not a JSON object')
+                continue
+            record_kind = record.get('type')
+            if record_kind == 'header':
+                if record.get('version', TRANSFER_VERSION) > TRANSFER_VERSION:
+                    raise ValueError(f"export version {record['version']} is newer than this app supports")
+                continue
+            if record_kind not in TABLES:
+                self.unreadable += 1
+                self._error(f'line {number}: unknown record type {record_kind!r}')
+                continue
+            if record_kind != kind or len(pending) >= self.batch_size:
+                self._flush(kind, pending)
+                pending, kind = [], record_kind
+            pending.append(record)
+        self._flush(kind, pending)
+        self._refresh_lending_state()
+        return self.summary()
+
+    def _error(self, message):
+        if len(self.errors) < 20:
+            self.errors.append(message)
+
+    def _prepare(self, kind, records):
+        """Column values for each record, with book references remapped; None for records to skip"""
+        columns = TABLES[kind][1]
+        rows = []
+        for record in records:
+            try:
+                row = _parse(columns, record)
+            except (TypeError, ValueError) as e:
+                self._error(f'{kind} {record.get("id")}: {e}')
+                rows.append(None)
+                continue
+            if kind != 'book':
+                book_id = self.book_ids.get(record.get('book_id'))
+                if book_id is None:
+                    self._error(f'{kind} {record.get("id")}: book {record.get("book_id")} was not imported')
+                    rows.append(None)
+                    continue
+                row['book_id'] = book_id
+            if kind == 'reading_list_item':
+                row['order'] = self.order_offset + (row.get('order') or 0)
+            rows.append(row)
+        return rows
+
+    def _flush(self, kind, records):
+        if not records:
+            return
+        table = TABLES[kind][0]
+        rows = self._prepare(kind, records)
+        batch = [(record, row) for record, row in zip(records, rows) if row is not None]
+        self.skipped[kind] += len(records) - len(batch)
+        if not batch:
+            return
+        try:
+            with self.conn.begin_nested():
+                self.conn.execute(insert(table), [row for _, row in batch])
+                # Inside our write transaction SQLite hands out max(id) + 1 per row, in order
+                last_id = self.conn.execute(select(func.max(table.c.id))).scalar()
+            new_ids = range(last_id - len(batch) + 1, last_id + 1)
+        except DBAPIError as e:
+            logging.warning(f"Import batch of {len(batch)} {kind} rows failed ({e.orig}), retrying row by row")
+            new_ids = []
+            for record, row in batch:
+                try:
+                    with self.conn.begin_nested():
+                        new_ids.append(self.conn.execute(insert(table), row).inserted_primary_key[0])
+                except DBAPIError as row_error:
+                    self._error(f'{kind} {record.get("id")}: {row_error.orig}')
+                    new_ids.append(None)
+        imported = [(record, row, new_id) for (record, row), new_id in zip(batch, new_ids) if new_id is not None]
+        self.counts[kind] += len(imported)
+        self.skipped[kind] += len(batch) - len(imported)
+        if kind == 'book' and imported:
+            for record, _, new_id in imported:
+                self.book_ids[record.get('id')] = new_id
+            if self.first_book_id is None:
+                self.first_book_id = imported[0][2]
+            sync_taxonomy_rows(self.conn, [(new_id, row.get('categories'), row.get('tags'))
+                                           for _, row, new_id in imported])
+
+    def _refresh_lending_state(self):
+        """Point the imported books at their open lending, as refresh_lending_state does per book"""
+        if self.first_book_id is None:
+            return
+        open_lending = select(lendings.c.id).where(
+            lendings.c.book_id == books.c.id,
+            lendings.c.return_date == None,
+            lendings.c.deleted == False,
+        ).limit(1).scalar_subquery()
+        self.conn.execute(update(books).where(books.c.id >= self.first_book_id).values(
+            current_lending_id=open_lending, is_lent=open_lending != None))
+
+    def summary(self):
+        return {'imported': dict(self.counts), 'skipped': dict(self.skipped),
+                'unreadable': self.unreadable, 'errors': list(self.errors)}
+
+
+def import_library(engine, lines, batch_size=TRANSFER_BATCH_SIZE):
+    """Import an export into this library in one transaction; returns counts and the first errors"""
+    with engine.begin() as conn:
+        # pysqlite doesn't open a transaction until the first insert, and a SAVEPOINT outside
+        # one starts its own that RELEASE commits, so the first batch would be committed on
+        # its own. Open the transaction up front so the batches' savepoints nest inside it
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        return LibraryImport(conn, batch_size).run(lines)
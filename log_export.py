@@ -0,0 +1,102 @@
+import csv
+import zlib
+from datetime import datetime, timedelta
+from io import StringIO
+
+from sqlalchemy import select, tuple_
+
+from models import RequestLog
+
+EXPORT_BATCH_SIZE = 1000
+
+HEADER = ['Timestamp', 'Method', 'Endpoint', 'Status', 'Response Time', 'IP', 'User Agent']
+
+logs = RequestLog.__table__
+
+
+def parse_filters(args):
+    """Turn the export's query string into filters; bad dates and statuses are ignored"""
+    filters = {}
+    for name in ('date_from', 'date_to'):
+        try:
+            filters[name] = datetime.strptime(args.get(name, ''), '%Y-%m-%d')
+        except ValueError:
+            pass
+    if args.get('endpoint'):
+        filters['endpoint'] = args['endpoint']
+    status = args.get('status', '')
+    if len(status) == 3 and status[0] in '12345' and status[1:] in ('xx', 'XX'):
+        low = int(status[0]) * 100
+        filters['status'] = (low, low + 99)
+    elif status.isdigit():
+        filters['status'] = (int(status), int(status))
+    return filters
+
+
+def filtered(statement, filters):
+    if 'date_from' in filters:
+        statement = statement.where(logs.c.timestamp >= filters['date_from'])
+    if 'date_to' in filters:
+        # The whole end day is included
+        statement = statement.where(logs.c.timestamp < filters['date_to'] + timedelta(days=1))
+    if 'endpoint' in filters:
+        statement = statement.where(logs.c.endpoint == filters['endpoint'])
+    if 'status' in filters:
+        low, high = filters['status']
+        statement = statement.where(logs.c.status_code.between(low, high))
+    return statement
+
+
+def iter_log_rows(engine, filters, batch_size=EXPORT_BATCH_SIZE):
+    """Newest-first log rows, read in keyset batches on (timestamp, id) so memory stays flat
+    and each batch is a short read rather than one transaction held open for the whole export
+    """
+    statement = filtered(select(
+        logs.c.id, logs.c.timestamp, logs.c.method, logs.c.endpoint, logs.c.status_code,
+        logs.c.response_time, logs.c.ip_address, logs.c.user_agent,
+    ), filters).order_by(logs.c.timestamp.desc(), logs.c.id.desc()).limit(batch_size)
+    after = None
+    while True:
+        batch = statement
+        if after is not None:
+            batch = batch.where(tuple_(logs.c.timestamp, logs.c.id) < tuple_(*after))
+        with engine.connect() as conn:
+            rows = conn.execute(batch).fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].timestamp, rows[-1].id)
+
+
+def iter_csv(engine, filters, batch_size=EXPORT_BATCH_SIZE):
+    """CSV text, one chunk per batch of rows"""
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HEADER)
+    yield out.getvalue()
+    for rows in iter_log_rows(engine, filters, batch_size):
+        out.seek(0)
+        out.truncate()
+        for row in rows:
+            writer.writerow([
+                row.timestamp,
+                row.method,
+                row.endpoint,
+                row.status_code,
+                f"{row.response_time:.2f}s",
+                row.ip_address,
+                row.user_agent
+            ])
+        yield out.getvalue()
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of text chunks into a gzip stream as they're produced"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,10 +1,12 @@
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
 import isbnlib
 from dataclasses import dataclass
 from typing import List
-import requests
 from sqlalchemy import or_, func
-from models import db, Book as SQLBook
+from models import db, Book as SQLBook, Category, Tag, book_categories, book_tags
+from isbn_cache import GOOGLE, OPENLIBRARY, MERGED
+from http_client import HttpClient
 import json
 
 @dataclass
@@ -21,8 +23,36 @@ class BookDTO:
     id: int = None
 
 class LibraryManager:
-    def __init__(self):
-        pass
+    def __init__(self, cache=None, http=None, max_workers=8, lookup_timeout=10):
+        # Optional IsbnCache; without one every lookup goes to the providers
+        self.cache = cache
+        # Pooled session shared by every provider call
+        self.http = http or HttpClient()
+        # Provider calls run side by side on a bounded pool and are abandoned after lookup_timeout seconds
+        self.lookup_timeout = lookup_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='provider')
+
+    def _fan_out(self, calls, timeout=None):
+        """Run provider calls concurrently and return whatever finished before the deadline.
+
+        `calls` maps a name to a (function, *args) tuple. Calls still running when the
+        deadline passes are left out of the result instead of being waited on.
+        """
+        timeout = self.lookup_timeout if timeout is None else timeout
+        futures = {self.executor.submit(fn, *args): name for name, (fn, *args) in calls.items()}
+        done, not_done = wait(futures, timeout=timeout)
+
+        for future in not_done:
+            future.cancel()
+            print(f"Provider call {futures[future]} missed the {timeout}s deadline, skipping it")
+
+        results = {}
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Error in provider call {futures[future]}: {e}")
+        return results
 
     def add_book(self, book_data):
         book = SQLBook(
@@ -89,28 +119,30 @@ class LibraryManager:
                 if ' ' in search_term:
                     search_type = 'author'
             
-            # Search both APIs with the appropriate parameters
-            google_results = []
+            # Search both APIs with the appropriate parameters, all at once
+            calls = {}
             if search_type == 'author':
                 # Only search by author
-                google_results = self.search_google_books_by_title_and_author('', search_term)
+                calls['google_author'] = (self.search_google_books_by_title_and_author, '', search_term)
             elif search_type == 'title':
                 # Only search by title
-                google_results = self.search_google_books_by_title_and_author(search_term)
+                calls['google_title'] = (self.search_google_books_by_title_and_author, search_term)
             else:
-                # First try exact title match
-                google_results = self.search_google_books_by_title_and_author(search_term)
-                
-                # If no results, try author search
-                if not google_results:
-                    google_results = self.search_google_books_by_title_and_author('', search_term)
+                # Run the title and author searches together instead of falling back one after the other
+                calls['google_title'] = (self.search_google_books_by_title_and_author, search_term)
+                calls['google_author'] = (self.search_google_books_by_title_and_author, '', search_term)
             
             # Get OpenLibrary results with the same search type
-            openlib_results = []
             if search_type == 'author':
-                openlib_results = self._search_openlibrary(f"author:{search_term}")
+                calls['openlibrary'] = (self._search_openlibrary, f"author:{search_term}")
             else:
-                openlib_results = self._search_openlibrary(search_term)
+                calls['openlibrary'] = (self._search_openlibrary, search_term)
+            
+            results = self._fan_out(calls)
+            
+            # Prefer title matches, fall back to author matches if there were none
+            google_results = results.get('google_title') or results.get('google_author') or []
+            openlib_results = results.get('openlibrary') or []
             
             # Combine and deduplicate results
             all_results = []
@@ -163,41 +195,42 @@ class LibraryManager:
 
     def get_all_categories(self):
         try:
-            # Get all non-deleted books with categories
-            books = SQLBook.query.filter(
-                SQLBook.deleted == False,
-                SQLBook.categories.isnot(None),
-                SQLBook.categories != ''
-            ).all()
-            
-            # Create a set of all unique categories
-            all_categories = set()
-            for book in books:
-                if book.categories:
-                    # Split categories if they contain commas
-                    categories = [cat.strip() for cat in book.categories.split(',')]
-                    all_categories.update(cat for cat in categories if cat)
-            
-            return sorted(list(all_categories))
+            # Distinct categories used by at least one non-deleted book, straight off the link table
+            rows = db.session.query(Category.name).join(
+                book_categories, book_categories.c.category_id == Category.id
+            ).join(
+                SQLBook, SQLBook.id == book_categories.c.book_id
+            ).filter(
+                SQLBook.deleted == False
+            ).group_by(Category.id).order_by(Category.name).all()
+            return [name for name, in rows]
         except Exception as e:
             print(f"Error getting categories: {e}")
             return []
 
     def get_all_tags(self):
-        books = SQLBook.query.filter(SQLBook.tags.isnot(None)).all()
-        all_tags = set()
-        for book in books:
-            if book.tags:
-                # Only split if there are multiple tags
-                tags = [tag.strip() for tag in book.tags.split(',') if tag.strip()]
-                all_tags.update(tags)
-        return sorted(list(all_tags))
+        rows = db.session.query(Tag.name).join(
+            book_tags, book_tags.c.tag_id == Tag.id
+        ).group_by(Tag.id).order_by(Tag.name).all()
+        return [name for name, in rows]
+
+    def get_category_counts(self):
+        """Number of non-deleted books in each category, as {name: count} sorted by name"""
+        rows = db.session.query(
+            Category.name, func.count(book_categories.c.book_id)
+        ).join(
+            book_categories, book_categories.c.category_id == Category.id
+        ).join(
+            SQLBook, SQLBook.id == book_categories.c.book_id
+        ).filter(
+            SQLBook.deleted == False
+        ).group_by(Category.id).order_by(Category.name).all()
+        return dict(rows)
 
     def get_google_books_data(self, isbn: str):
         try:
             url = f'https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}'
-            response = requests.get(url)
-            data = response.json()
+            data = self.http.get_google_books(url)
 
             if data.get('items'):
                 volume_info = data['items'][0]['volumeInfo']
@@ -213,8 +246,7 @@ class LibraryManager:
     def search_google_books_by_title(self, title: str):
         try:
             url = f'https://www.googleapis.com/books/v1/volumes?q=intitle:{title}&maxResults=5'
-            response = requests.get(url)
-            data = response.json()
+            data = self.http.get_google_books(url)
             
             results = []
             if data.get('items'):
@@ -244,8 +276,7 @@ class LibraryManager:
                 query += f'+inauthor:{author}'
             
             url = f'https://www.googleapis.com/books/v1/volumes?q={query}'
-            response = requests.get(url)
-            data = response.json()
+            data = self.http.get_google_books(url)
             
             results = []
             if data.get('items'):
@@ -274,154 +305,131 @@ class LibraryManager:
 
     def get_book_data_by_isbn(self, isbn: str):
         try:
-            # Get data from both sources
-            google_data = self._get_google_books_data(isbn)
-            openlib_data = self._get_openlibrary_data(isbn)
-            
-            # If neither source has data, return None
-            if not google_data and not openlib_data:
-                return None
-            
-            # Merge the data, preferring Google Books when both exist
-            merged_data = {
-                'title': None,
-                'author': None,
-                'isbn': isbn,
-                'publication_date': None,
-                'pages': None,
-                'categories': None
-            }
-            
-            # Helper function to merge categories
-            def merge_categories(cat1, cat2):
-                categories = set()
-                # Add non-empty categories from both sources
-                if cat1:
-                    categories.update(cat1.split(', '))
-                if cat2:
-                    categories.update(cat2.split(', '))
-                return ', '.join(sorted(categories)) if categories else None
-            
-            # Merge logic for each field
-            if google_data and openlib_data:
-                merged_data.update({
-                    'title': google_data.get('title') or openlib_data.get('title'),
-                    'author': google_data.get('author') or openlib_data.get('author'),
-                    'publication_date': google_data.get('publishedDate') or openlib_data.get('publish_date'),
-                    'pages': google_data.get('pageCount') or openlib_data.get('number_of_pages'),
-                    'categories': merge_categories(google_data.get('categories'), openlib_data.get('categories'))
-                })
-            elif google_data:
-                merged_data.update(google_data)
-            else:
-                merged_data.update(openlib_data)
-            
-            # Final validation and cleanup
-            if not merged_data['title']:
-                return None
-            
-            print(f"Merged book data for ISBN {isbn}:")
-            print(f"Title: {merged_data['title']}")
-            print(f"Author: {merged_data['author']}")
-            print(f"Categories: {merged_data['categories']}")
-            print(f"Pages: {merged_data['pages']}")
-            
+            if self.cache:
+                found, cached = self.cache.get(isbn, MERGED)
+                if found:
+                    return cached
+
+            # Get data from both sources concurrently; a provider that misses the deadline counts as failed
+            results = self._fan_out({
+                GOOGLE: (self._lookup_provider, GOOGLE, isbn, self._fetch_google_books_data),
+                OPENLIBRARY: (self._lookup_provider, OPENLIBRARY, isbn, self._fetch_openlibrary_data),
+            })
+            google_data, google_ok = results.get(GOOGLE, (None, False))
+            openlib_data, openlib_ok = results.get(OPENLIBRARY, (None, False))
+            merged_data = self._merge_book_data(isbn, google_data, openlib_data)
+
+            # Don't remember the merged record if a provider errored out, the next lookup should retry it
+            if self.cache and google_ok and openlib_ok:
+                self.cache.set(isbn, MERGED, merged_data)
+
             return merged_data
-            
+
         except Exception as e:
             print(f"Error merging ISBN data: {e}")
             return None
 
-    def _get_google_books_data(self, isbn: str):
+    def _lookup_provider(self, source, isbn, fetch):
+        """Return (data, ok) for one provider, going through the cache when there is one"""
+        if self.cache:
+            found, data = self.cache.get(isbn, source)
+            if found:
+                return data, True
         try:
-            url = f'https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}'
-            response = requests.get(url)
-            data = response.json()
-            
-            if data.get('items'):
-                volume_info = data['items'][0]['volumeInfo']
-                categories = volume_info.get('categories', [])
-                
-                if isinstance(categories, str):
-                    categories = [categories]
-                elif not isinstance(categories, list):
-                    categories = []
-                    
-                return {
-                    'title': volume_info.get('title'),
-                    'author': ', '.join(volume_info.get('authors', [])),
-                    'isbn': isbn,
-                    'publication_date': volume_info.get('publishedDate'),
-                    'pages': volume_info.get('pageCount'),
-                    'categories': ', '.join(categories) if categories else None
-                }
+            data = fetch(isbn)
+        except Exception as e:
+            print(f"Error fetching {source} data for ISBN {isbn}: {e}")
+            return None, False
+        if self.cache:
+            self.cache.set(isbn, source, data)
+        return data, True
+
+    def _merge_book_data(self, isbn, google_data, openlib_data):
+        """Combine provider results into one record, preferring Google Books when both exist"""
+        # If neither source has data, return None
+        if not google_data and not openlib_data:
+            return None
+        
+        # Merge the data, preferring Google Books when both exist
+        merged_data = {
+            'title': None,
+            'author': None,
+            'isbn': isbn,
+            'publication_date': None,
+            'pages': None,
+            'categories': None
+        }
+        
+        # Helper function to merge categories
+        def merge_categories(cat1, cat2):
+            categories = set()
+            # Add non-empty categories from both sources
+            if cat1:
+                categories.update(cat1.split(', '))
+            if cat2:
+                categories.update(cat2.split(', '))
+            return ', '.join(sorted(categories)) if categories else None
+        
+        # Merge logic for each field
+        if google_data and openlib_data:
+            merged_data.update({
+                'title': google_data.get('title') or openlib_data.get('title'),
+                'author': google_data.get('author') or openlib_data.get('author'),
+                'publication_date': google_data.get('publishedDate') or openlib_data.get('publish_date'),
+                'pages': google_data.get('pageCount') or openlib_data.get('number_of_pages'),
+                'categories': merge_categories(google_data.get('categories'), openlib_data.get('categories'))
+            })
+        elif google_data:
+            merged_data.update(google_data)
+        else:
+            merged_data.update(openlib_data)
+        
+        # Final validation and cleanup
+        if not merged_data['title']:
             return None
+        
+        print(f"Merged book data for ISBN {isbn}:")
+        print(f"Title: {merged_data['title']}")
+        print(f"Author: {merged_data['author']}")
+        print(f"Categories: {merged_data['categories']}")
+        print(f"Pages: {merged_data['pages']}")
+        
+        return merged_data
+
+    def _get_google_books_data(self, isbn: str):
+        try:
+            return self._fetch_google_books_data(isbn)
         except Exception as e:
             print(f"Error fetching Google Books data: {e}")
             return None
 
-    def _get_openlibrary_data(self, isbn: str):
-        try:
-            print(f"\n=== OpenLibrary ISBN Lookup Debug ===")
-            print(f"Looking up ISBN: {isbn}")
-            
-            url = f'https://openlibrary.org/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data'
-            print(f"URL: {url}")
-            
-            response = requests.get(url)
-            data = response.json()
-            print(f"Raw Response: {json.dumps(data, indent=2)}")
+    def _fetch_google_books_data(self, isbn: str):
+        """Look up an ISBN on Google Books; returns None when not found and raises on request errors"""
+        url = f'https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}'
+        data = self.http.get_google_books(url)
+        
+        if data.get('items'):
+            volume_info = data['items'][0]['volumeInfo']
+            categories = volume_info.get('categories', [])
             
-            book_key = f'ISBN:{isbn}'
-            if book_key in data:
-                book_info = data[book_key]
-                print(f"Book Info: {json.dumps(book_info, indent=2)}")
-                
-                # Extract authors - handle both string and dict formats
-                authors = []
-                raw_authors = book_info.get('authors', [])
-                print(f"Raw Authors: {raw_authors}")
-                
-                for author in raw_authors:
-                    if isinstance(author, dict):
-                        authors.append(author.get('name', ''))
-                    else:
-                        authors.append(str(author))
-                
-                # Handle subjects - similar approach
+            if isinstance(categories, str):
+                categories = [categories]
+            elif not isinstance(categories, list):
                 categories = []
-                raw_subjects = book_info.get('subjects', [])
-                print(f"Raw Subjects: {raw_subjects}")
-                
-                for subject in raw_subjects[:2]:  # Limit to 2 subjects
-                    if isinstance(subject, dict):
-                        categories.append(subject.get('name', ''))
-                    else:
-                        categories.append(str(subject))
                 
-                # Add a place if available
-                raw_places = book_info.get('subject_places', [])
-                if raw_places:
-                    place = raw_places[0]
-                    if isinstance(place, dict):
-                        categories.append(place.get('name', ''))
-                    else:
-                        categories.append(str(place))
-                
-                result = {
-                    'title': book_info.get('title'),
-                    'author': ', '.join(authors),
-                    'isbn': isbn,
-                    'publication_date': book_info.get('publish_date'),
-                    'pages': book_info.get('number_of_pages'),
-                    'categories': ', '.join(categories) if categories else None
-                }
-                print(f"Final Processed Result: {json.dumps(result, indent=2)}")
-                return result
-                
-            print("ISBN not found in initial lookup, trying works API...")
-            return None
-            
+            return {
+                'title': volume_info.get('title'),
+                'author': ', '.join(volume_info.get('authors', [])),
+                'isbn': isbn,
+                'publication_date': volume_info.get('publishedDate'),
+                'pages': volume_info.get('pageCount'),
+                'categories': ', '.join(categories) if categories else None
+            }
+        return None
+
+    def _get_openlibrary_data(self, isbn: str):
+        try:
+            return self._fetch_openlibrary_data(isbn)
         except Exception as e:
             print(f"Error in OpenLibrary lookup: {str(e)}")
             print(f"Error type: {type(e)}")
@@ -429,6 +437,147 @@ class LibraryManager:
             print(traceback.format_exc())
             return None
 
+    def _fetch_openlibrary_data(self, isbn: str):
+        """Look up an ISBN on OpenLibrary; returns None when not found and raises on request errors"""
+        print(f"\n=== OpenLibrary ISBN Lookup Debug ===")
+        print(f"Looking up ISBN: {isbn}")
+        
+        url = f'https://openlibrary.org/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data'
+        print(f"URL: {url}")
+        
+        data = self.http.get_json(url)
+        print(f"Raw Response: {json.dumps(data, indent=2)}")
+        
+        book_key = f'ISBN:{isbn}'
+        if book_key in data:
+            book_info = data[book_key]
+            print(f"Book Info: {json.dumps(book_info, indent=2)}")
+            
+            result = self._parse_openlibrary_book(isbn, book_info)
+            print(f"Final Processed Result: {json.dumps(result, indent=2)}")
+            return result
+            
+        print("ISBN not found in initial lookup, trying works API...")
+        return None
+
+    def _parse_openlibrary_book(self, isbn: str, book_info: dict):
+        """Map one entry of an OpenLibrary bibkeys response onto our book fields"""
+        # Extract authors - handle both string and dict formats
+        authors = []
+        raw_authors = book_info.get('authors', [])
+        
+        for author in raw_authors:
+            if isinstance(author, dict):
+                authors.append(author.get('name', ''))
+            else:
+                authors.append(str(author))
+        
+        # Handle subjects - similar approach
+        categories = []
+        raw_subjects = book_info.get('subjects', [])
+        
+        for subject in raw_subjects[:2]:  # Limit to 2 subjects
+            if isinstance(subject, dict):
+                categories.append(subject.get('name', ''))
+            else:
+                categories.append(str(subject))
+        
+        # Add a place if available
+        raw_places = book_info.get('subject_places', [])
+        if raw_places:
+            place = raw_places[0]
+            if isinstance(place, dict):
+                categories.append(place.get('name', ''))
+            else:
+                categories.append(str(place))
+        
+        return {
+            'title': book_info.get('title'),
+            'author': ', '.join(authors),
+            'isbn': isbn,
+            'publication_date': book_info.get('publish_date'),
+            'pages': book_info.get('number_of_pages'),
+            'categories': ', '.join(categories) if categories else None
+        }
+
+    def get_openlibrary_data_batch(self, isbns):
+        """Look up many ISBNs with a single bibkeys request; returns {isbn: data or None} and raises on request errors"""
+        bibkeys = ','.join(f'ISBN:{isbn}' for isbn in isbns)
+        url = f'https://openlibrary.org/api/books?bibkeys={bibkeys}&format=json&jscmd=data'
+        data = self.http.get_json(url)
+        
+        results = {}
+        for isbn in isbns:
+            book_info = data.get(f'ISBN:{isbn}')
+            results[isbn] = self._parse_openlibrary_book(isbn, book_info) if book_info else None
+        return results
+
+    def get_book_data_by_isbns(self, isbns, rate_limiter=None, executor=None, batch_size=50):
+        """Bulk version of get_book_data_by_isbn; returns {isbn: merged data or None}.
+
+        OpenLibrary is asked for `batch_size` ISBNs per request, Google Books one ISBN per
+        request throttled by `rate_limiter`. Both go through the cache like single lookups.
+        """
+        executor = executor or self.executor
+        results = {}
+        pending = []
+        for isbn in dict.fromkeys(isbns):
+            if self.cache:
+                found, cached = self.cache.get(isbn, MERGED)
+                if found:
+                    results[isbn] = cached
+                    continue
+            pending.append(isbn)
+        if not pending:
+            return results
+        
+        openlib, openlib_ok = {}, {}
+        to_fetch = []
+        for isbn in pending:
+            found, data = self.cache.get(isbn, OPENLIBRARY) if self.cache else (False, None)
+            if found:
+                openlib[isbn], openlib_ok[isbn] = data, True
+            else:
+                to_fetch.append(isbn)
+        
+        def fetch_google(isbn):
+            if rate_limiter:
+                rate_limiter.acquire()
+            return self._fetch_google_books_data(isbn)
+        
+        # OpenLibrary batches and the throttled Google lookups all share the pool
+        openlib_futures = {
+            executor.submit(self.get_openlibrary_data_batch, to_fetch[i:i + batch_size]): to_fetch[i:i + batch_size]
+            for i in range(0, len(to_fetch), batch_size)
+        }
+        google_futures = {
+            executor.submit(self._lookup_provider, GOOGLE, isbn, fetch_google): isbn
+            for isbn in pending
+        }
+        
+        for future in as_completed(openlib_futures):
+            batch = openlib_futures[future]
+            try:
+                fetched = future.result()
+            except Exception as e:
+                print(f"Error in OpenLibrary batch lookup of {len(batch)} ISBNs: {e}")
+                openlib_ok.update((isbn, False) for isbn in batch)
+                continue
+            for isbn, data in fetched.items():
+                openlib[isbn], openlib_ok[isbn] = data, True
+                if self.cache:
+                    self.cache.set(isbn, OPENLIBRARY, data)
+        
+        for future in as_completed(google_futures):
+            isbn = google_futures[future]
+            google_data, google_ok = future.result()
+            merged_data = self._merge_book_data(isbn, google_data, openlib.get(isbn))
+            if self.cache and google_ok and openlib_ok.get(isbn):
+                self.cache.set(isbn, MERGED, merged_data)
+            results[isbn] = merged_data
+        
+        return results
+
     def add_book_by_isbn(self, isbn: str, chapters: int = None):
         """Add a book to the database using ISBN lookup."""
         book_data = self.get_book_data_by_isbn(isbn)
@@ -466,8 +615,7 @@ class LibraryManager:
                 url = f'https://openlibrary.org/api/books?bibkeys=ISBN:{clean_isbn}&format=json&jscmd=data'
                 print(f"\nTrying URL: {url}")
                 
-                response = requests.get(url)
-                data = response.json()
+                data = self.http.get_json(url)
                 
                 print("\nRaw OpenLibrary Response:")
                 print(json.dumps(data, indent=2))
@@ -514,8 +662,14 @@ class LibraryManager:
             all_results = []
             seen_keys = set()
             
+            # Query both providers at the same time
+            results = self._fan_out({
+                'google': (self.search_google_books_by_title_and_author, title, author),
+                'openlibrary': (self._search_openlibrary_docs, title, author),
+            })
+            
             # Search Google Books
-            google_results = self.search_google_books_by_title_and_author(title, author)
+            google_results = results.get('google')
             if google_results:
                 for book in google_results:
                     key = f"{book.get('title')}|{', '.join(book.get('authors', []))}"
@@ -531,39 +685,26 @@ class LibraryManager:
                             'source': 'Google Books'
                         })
             
-            # Search OpenLibrary with better query construction
-            try:
-                url = f'https://openlibrary.org/search.json?q={title}'
-                if author:
-                    url += f'+author:{author}'
-                
-                print(f"OpenLibrary search URL: {url}")
-                response = requests.get(url)
-                data = response.json()
-                
-                if data.get('docs'):
-                    for doc in data['docs'][:5]:  # Limit to first 5 results
-                        key = f"{doc.get('title')}|{', '.join(doc.get('author_name', []))}"
-                        if key not in seen_keys:
-                            seen_keys.add(key)
-                            categories = []
-                            if doc.get('subject', []):
-                                categories.extend(doc['subject'][:2])
-                            if doc.get('place', []):
-                                categories.extend(doc['place'][:1])
-                            
-                            all_results.append({
-                                'title': doc.get('title'),
-                                'author': ', '.join(doc.get('author_name', [])),
-                                'isbn': doc.get('isbn', [''])[0] if doc.get('isbn') else '',
-                                'publication_date': str(doc.get('first_publish_year', '')),
-                                'pages': doc.get('number_of_pages'),
-                                'categories': ', '.join(categories) if categories else '',
-                                'source': 'OpenLibrary'
-                            })
-            
-            except Exception as e:
-                print(f"Error in OpenLibrary search: {e}")
+            # Add unique OpenLibrary results
+            for doc in results.get('openlibrary') or []:
+                key = f"{doc.get('title')}|{', '.join(doc.get('author_name', []))}"
+                if key not in seen_keys:
+                    seen_keys.add(key)
+                    categories = []
+                    if doc.get('subject', []):
+                        categories.extend(doc['subject'][:2])
+                    if doc.get('place', []):
+                        categories.extend(doc['place'][:1])
+                    
+                    all_results.append({
+                        'title': doc.get('title'),
+                        'author': ', '.join(doc.get('author_name', [])),
+                        'isbn': doc.get('isbn', [''])[0] if doc.get('isbn') else '',
+                        'publication_date': str(doc.get('first_publish_year', '')),
+                        'pages': doc.get('number_of_pages'),
+                        'categories': ', '.join(categories) if categories else '',
+                        'source': 'OpenLibrary'
+                    })
             
             return all_results[:10]
         
@@ -571,6 +712,20 @@ class LibraryManager:
             print(f"Error in combined search: {e}")
             return []
 
+    def _search_openlibrary_docs(self, title: str, author: str):
+        try:
+            # Search OpenLibrary with better query construction
+            url = f'https://openlibrary.org/search.json?q={title}'
+            if author:
+                url += f'+author:{author}'
+            
+            print(f"OpenLibrary search URL: {url}")
+            data = self.http.get_json(url)
+            return data.get('docs', [])[:5]  # Limit to first 5 results
+        except Exception as e:
+            print(f"Error in OpenLibrary search: {e}")
+            return []
+
 def format_isbn(isbn: str) -> str:
     # Remove any existing hyphens and spaces
     isbn = ''.join(c for c in isbn if c.isdigit())
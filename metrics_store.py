@@ -0,0 +1,463 @@
+import json
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, inspect, select, delete, func, case, cast, Integer
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from models import Book, BookLending, ReadingListItem, RequestLog, MetricCounter, Category, book_categories
+from taxonomy import split_names
+from rollups import request_totals, WATERMARK
+
+# Lendings open for longer than this many days count as overdue
+OVERDUE_DAYS = 14
+
+# The row that isn't a plain counter: the leaderboard snapshot, kept current by the flush hook.
+# Its value is the counters' format; databases on an older one are reconciled at startup
+LEADERS = 'leaders'
+COUNTERS_VERSION = 2
+NO_LEADERS = {'longest_book': None, 'most_borrowed_book': None, 'most_frequent_borrower': None}
+# Rows reconciliation leaves alone
+STATE_ROWS = (LEADERS, WATERMARK)
+
+counters = MetricCounter.__table__
+
+# Columns each model's counters are derived from; only flushes touching these do any work
+TRACKED = {
+    Book: ('deleted', 'pages', 'chapters', 'read', 'acquisition_date', 'categories', 'title'),
+    BookLending: ('deleted', 'lent_date', 'return_date', 'borrower_name'),
+    ReadingListItem: ('completed', 'completed_date', 'added_date', 'book_id'),
+    RequestLog: ('method', 'status_code'),
+}
+
+
+def _not_deleted(column):
+    # `deleted` defaults to False but older rows may hold NULL
+    return column.isnot(True)
+
+
+def book_counts(get):
+    if get('deleted'):
+        return {}
+    counts = {'books': 1, 'pages': get('pages') or 0, 'chapters': get('chapters') or 0}
+    if get('read'):
+        counts['books_read'] = 1
+    if get('acquisition_date'):
+        counts[f"acquired:{get('acquisition_date').year}"] = 1
+    for name in split_names(get('categories')):
+        counts[f'category:{name}'] = 1
+    return counts
+
+
+def lending_counts(get):
+    if get('deleted'):
+        return {}
+    lent, returned = get('lent_date'), get('return_date')
+    counts = {f'lent_month:{lent:%Y-%m}': 1} if lent else {}
+    if get('borrower_name'):
+        counts[f"borrower:{get('borrower_name')}"] = 1
+    if returned is None:
+        counts['lendings_active'] = 1
+        if lent:
+            # Active lendings bucketed by day, so overdue is a sum over the old buckets
+            counts[f'lent_active:{lent.isoformat()}'] = 1
+    else:
+        counts['lendings_returned'] = 1
+        if lent:
+            counts['lending_days'] = (returned - lent).days
+            counts['lending_days_count'] = 1
+    return counts
+
+
+def reading_item_counts(get, book_deleted):
+    counts = {}
+    # The reading list totals only include items whose book is on the shelf
+    if not book_deleted:
+        counts['reading_list'] = 1
+        if get('completed'):
+            counts['reading_list_completed'] = 1
+    if get('completed') and get('completed_date') and get('added_date'):
+        counts['reading_days'] = (get('completed_date') - get('added_date')).days
+        counts['reading_days_count'] = 1
+    return counts
+
+
+def request_counts(method, status_code):
+    counts = {'requests': 1}
+    if method in ('GET', 'POST'):
+        counts[f'requests_{method.lower()}'] = 1
+    if status_code is not None:
+        if 200 <= status_code <= 299:
+            counts['requests_success'] = 1
+        elif status_code >= 400:
+            counts['requests_error'] = 1
+    return counts
+
+
+def apply_deltas(conn, deltas):
+    """Add {name: delta} to the stored counters in the caller's transaction"""
+    rows = [{'name': name, 'value': value, 'updated_at': datetime.utcnow()}
+            for name, value in deltas.items() if value]
+    if not rows:
+        return
+    stmt = insert(counters).values(rows)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[counters.c.name],
+        set_={'value': counters.c.value + stmt.excluded.value, 'updated_at': stmt.excluded.updated_at}
+    ))
+
+
+def _current(obj):
+    return lambda attr: getattr(obj, attr)
+
+
+def _previous(obj):
+    """Getter for the values an object had before this flush"""
+    state = inspect(obj)
+
+    def get(attr):
+        history = state.attrs[attr].history
+        if history.deleted:
+            return history.deleted[0]
+        if history.added:
+            return None
+        return getattr(obj, attr)
+    return get
+
+
+def _changed(obj, attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def _add(deltas, counts, sign=1):
+    for name, value in counts.items():
+        deltas[name] += sign * value
+
+
+@event.listens_for(Session, 'after_flush')
+def update_metric_counters(session, flush_context):
+    """Fold this flush's Book/BookLending/ReadingListItem/RequestLog changes into the counters"""
+    changes = []
+    for kind, objects in (('new', session.new), ('dirty', session.dirty), ('deleted', session.deleted)):
+        for obj in objects:
+            attrs = TRACKED.get(type(obj))
+            if attrs and (kind != 'dirty' or _changed(obj, attrs)):
+                changes.append((kind, obj))
+    if not changes:
+        return
+
+    conn = session.connection()
+    deltas = defaultdict(int)
+    # Books whose leaderboard standing may have moved: edited ones, and ones whose lendings changed
+    leader_books, lent_books = set(), set()
+
+    with session.no_autoflush:
+        # Shelf state of the books whose reading list items changed, before and after this flush
+        books_before, books_after = {}, {}
+        touched_items = set()
+        for kind, obj in changes:
+            if isinstance(obj, Book) and kind != 'new':
+                books_before[obj.id] = bool(_previous(obj)('deleted'))
+            if isinstance(obj, Book) and kind != 'deleted':
+                books_after[obj.id] = bool(obj.deleted)
+            if isinstance(obj, ReadingListItem):
+                touched_items.add(obj.id)
+        item_book_ids = {obj.book_id for _, obj in changes if isinstance(obj, ReadingListItem)} | \
+            {_previous(obj)('book_id') for kind, obj in changes if isinstance(obj, ReadingListItem) and kind != 'new'}
+        unknown = {book_id for book_id in item_book_ids if book_id is not None and book_id not in books_after}
+        if unknown:
+            for book_id, deleted in conn.execute(
+                select(Book.id, Book.deleted).where(Book.id.in_(unknown))
+            ).all():
+                books_after[book_id] = bool(deleted)
+
+        for kind, obj in changes:
+            if isinstance(obj, RequestLog):
+                # Request totals count everything ever logged, so deleting old rows leaves them alone
+                if kind == 'new':
+                    _add(deltas, request_counts(obj.method, obj.status_code))
+                continue
+
+            if isinstance(obj, ReadingListItem):
+                if kind != 'new':
+                    before = _previous(obj)
+                    book_id = before('book_id')
+                    deleted = books_before.get(book_id, books_after.get(book_id, False))
+                    _add(deltas, reading_item_counts(before, deleted), -1)
+                if kind != 'deleted':
+                    _add(deltas, reading_item_counts(_current(obj), books_after.get(obj.book_id, False)))
+                continue
+
+            count = book_counts if isinstance(obj, Book) else lending_counts
+            if kind != 'new':
+                _add(deltas, count(_previous(obj)), -1)
+            if kind != 'deleted':
+                _add(deltas, count(_current(obj)))
+            if isinstance(obj, Book):
+                leader_books.add(obj.id)
+            else:
+                lent_books.update({obj.book_id, _previous(obj)('book_id')} - {None})
+
+        # A book leaving or returning to the shelf takes its untouched reading list items with it
+        for book_id, was_deleted in books_before.items():
+            if book_id in books_after and books_after[book_id] != was_deleted:
+                total, completed = conn.execute(
+                    select(func.count(), func.sum(case((ReadingListItem.completed == True, 1), else_=0)))
+                    .where(ReadingListItem.book_id == book_id, ReadingListItem.id.notin_(touched_items))
+                ).one()
+                sign = -1 if books_after[book_id] else 1
+                deltas['reading_list'] += sign * total
+                deltas['reading_list_completed'] += sign * (completed or 0)
+
+    borrowers = {name.split(':', 1)[1]: value for name, value in deltas.items()
+                 if name.startswith('borrower:') and value}
+    apply_deltas(conn, deltas)
+    if leader_books or lent_books:
+        _update_leaders(conn, leader_books, lent_books | leader_books, borrowers)
+
+
+def _set(conn, name, value, data=None):
+    stmt = insert(counters).values(name=name, value=value, data=data, updated_at=datetime.utcnow())
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[counters.c.name],
+        set_={'value': stmt.excluded.value, 'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+    ))
+
+
+# Load the old value when one of these is assigned, so the flush hook can subtract it even
+# if the attribute had been expired by an earlier commit
+for _model, _attrs in TRACKED.items():
+    for _attr in _attrs:
+        event.listen(getattr(_model, _attr), 'set', lambda *args: None, active_history=True)
+
+
+def _days(end, start):
+    return cast(func.julianday(end) - func.julianday(start), Integer)
+
+
+def _longest_books(conn, book_ids=None):
+    query = select(Book.id, Book.title, Book.pages).where(_not_deleted(Book.deleted), Book.pages.isnot(None))
+    if book_ids is not None:
+        query = query.where(Book.id.in_(book_ids))
+    row = conn.execute(query.order_by(Book.pages.desc()).limit(1)).first()
+    return dict(row._mapping) if row else None
+
+
+def _borrowed_books(conn, book_ids=None):
+    """{book id: (id, title, borrow_count)} for `book_ids`, or the most borrowed book when None"""
+    borrow_count = func.count(BookLending.id).label('borrow_count')
+    query = (select(Book.id, Book.title, borrow_count)
+             .join(BookLending, BookLending.book_id == Book.id)
+             .where(_not_deleted(Book.deleted), _not_deleted(BookLending.deleted))
+             .group_by(Book.id))
+    if book_ids is None:
+        query = query.order_by(borrow_count.desc()).limit(1)
+    else:
+        query = query.where(Book.id.in_(book_ids))
+    return {row.id: dict(row._mapping) for row in conn.execute(query)}
+
+
+def _top_borrower(conn):
+    row = conn.execute(
+        select(counters.c.name, counters.c.value).where(counters.c.name.like('borrower:%'), counters.c.value > 0)
+        .order_by(counters.c.value.desc()).limit(1)
+    ).first()
+    return {'borrower_name': row.name.split(':', 1)[1], 'borrow_count': row.value} if row else None
+
+
+def _compute_leaders(conn):
+    """Snapshot of the dashboard entries that need a GROUP BY or sort over whole tables"""
+    most_borrowed = list(_borrowed_books(conn).values())
+    return {
+        'longest_book': _longest_books(conn),
+        'most_borrowed_book': most_borrowed[0] if most_borrowed else None,
+        'most_frequent_borrower': _top_borrower(conn),
+    }
+
+
+def _refresh_leaders(conn):
+    leaders = _compute_leaders(conn)
+    _set(conn, LEADERS, COUNTERS_VERSION, json.dumps(leaders))
+    return leaders
+
+
+def _update_leaders(conn, edited_books, lent_books, borrowers):
+    """Move the leaderboard snapshot along with a flush's changes.
+
+    Only the books and borrowers the flush touched are looked at, through the primary key,
+    the lending book_id index and the borrower counters. An entry is recomputed over its
+    whole table only when its current leader lost ground.
+    """
+    row = conn.execute(select(counters.c.value, counters.c.data).where(counters.c.name == LEADERS)).first()
+    if row is None or row.value != COUNTERS_VERSION:
+        # Never computed, or from before the borrower counters: reconciliation rebuilds it
+        return
+    leaders = {**NO_LEADERS, **json.loads(row.data)}
+
+    longest = leaders['longest_book']
+    if edited_books:
+        if longest and longest['id'] in edited_books:
+            leaders['longest_book'] = _longest_books(conn)
+        else:
+            best = _longest_books(conn, edited_books)
+            if best and (longest is None or best['pages'] > longest['pages']):
+                leaders['longest_book'] = best
+
+    top = leaders['most_borrowed_book']
+    if lent_books:
+        counts = _borrowed_books(conn, lent_books)
+        if top and top['id'] in lent_books and counts.get(top['id'], {'borrow_count': 0})['borrow_count'] < top['borrow_count']:
+            leaders['most_borrowed_book'] = next(iter(_borrowed_books(conn).values()), None)
+        else:
+            best = max(counts.values(), key=lambda book: book['borrow_count'], default=None)
+            if best and (top is None or best['borrow_count'] > top['borrow_count'] or best['id'] == top['id']):
+                leaders['most_borrowed_book'] = best
+
+    if borrowers:
+        after = dict(conn.execute(select(counters.c.name, counters.c.value).where(
+            counters.c.name.in_([f'borrower:{name}' for name in borrowers]))).all())
+        after = {name: after.get(f'borrower:{name}', 0) for name in borrowers}
+        # Borrowers going from no lendings to some, or back
+        apply_deltas(conn, {'unique_borrowers': sum((after[name] > 0) - (after[name] - delta > 0)
+                                                    for name, delta in borrowers.items())})
+        top = leaders['most_frequent_borrower']
+        if top and top['borrower_name'] in after and after[top['borrower_name']] < top['borrow_count']:
+            leaders['most_frequent_borrower'] = _top_borrower(conn)
+        else:
+            name = max(after, key=after.get)
+            if after[name] > 0 and (top is None or after[name] > top['borrow_count'] or name == top['borrower_name']):
+                leaders['most_frequent_borrower'] = {'borrower_name': name, 'borrow_count': after[name]}
+
+    _set(conn, LEADERS, COUNTERS_VERSION, json.dumps(leaders))
+
+
+def compute_counters(conn):
+    """Every counter recomputed from the source tables"""
+    values = defaultdict(int)
+
+    books = conn.execute(select(
+        func.count(), func.sum(Book.pages), func.sum(Book.chapters),
+        func.sum(case((Book.read == True, 1), else_=0))
+    ).where(_not_deleted(Book.deleted))).one()
+    values.update(books=books[0], pages=books[1] or 0, chapters=books[2] or 0, books_read=books[3] or 0)
+
+    year = func.strftime('%Y', Book.acquisition_date)
+    for acquired, count in conn.execute(
+        select(year, func.count()).where(_not_deleted(Book.deleted), Book.acquisition_date.isnot(None)).group_by(year)
+    ):
+        values[f'acquired:{int(acquired)}'] = count
+
+    for name, count in conn.execute(
+        select(Category.name, func.count())
+        .join(book_categories, book_categories.c.category_id == Category.id)
+        .join(Book, Book.id == book_categories.c.book_id)
+        .where(_not_deleted(Book.deleted)).group_by(Category.id)
+    ):
+        values[f'category:{name}'] = count
+
+    lendings = _not_deleted(BookLending.deleted)
+    for borrower, count in conn.execute(
+        select(BookLending.borrower_name, func.count()).where(lendings).group_by(BookLending.borrower_name)
+    ):
+        values[f'borrower:{borrower}'] = count
+        values['unique_borrowers'] += 1
+    month = func.strftime('%Y-%m', BookLending.lent_date)
+    for lent_month, count in conn.execute(select(month, func.count()).where(lendings).group_by(month)):
+        values[f'lent_month:{lent_month}'] = count
+    for lent_date, count in conn.execute(
+        select(BookLending.lent_date, func.count())
+        .where(lendings, BookLending.return_date.is_(None)).group_by(BookLending.lent_date)
+    ):
+        values[f'lent_active:{lent_date.isoformat()}'] = count
+        values['lendings_active'] += count
+    returned = conn.execute(
+        select(func.count(), func.sum(_days(BookLending.return_date, BookLending.lent_date)))
+        .where(lendings, BookLending.return_date.isnot(None))
+    ).one()
+    values.update(lendings_returned=returned[0], lending_days=returned[1] or 0, lending_days_count=returned[0])
+
+    reading = conn.execute(
+        select(func.count(), func.sum(case((ReadingListItem.completed == True, 1), else_=0)))
+        .join(Book, Book.id == ReadingListItem.book_id).where(_not_deleted(Book.deleted))
+    ).one()
+    values.update(reading_list=reading[0], reading_list_completed=reading[1] or 0)
+    reading_days = conn.execute(
+        select(func.count(), func.sum(_days(ReadingListItem.completed_date, ReadingListItem.added_date)))
+        .where(ReadingListItem.completed == True,
+               ReadingListItem.completed_date.isnot(None), ReadingListItem.added_date.isnot(None))
+    ).one()
+    values.update(reading_days=reading_days[1] or 0, reading_days_count=reading_days[0])
+
+    # Raw request logs are deleted after a while, so count from the rollups plus the newest rows
+    for method, status_code, count in request_totals(conn):
+        _add(values, {name: value * count for name, value in request_counts(method, status_code).items()})
+
+    return {name: value for name, value in values.items() if value}
+
+
+def reconcile_metrics(engine):
+    """Rewrite every counter from the source tables, correcting any drift.
+
+    Returns {name: (stored, actual)} for the counters that were off.
+    """
+    with engine.begin() as conn:
+        stored = dict(conn.execute(
+            select(counters.c.name, counters.c.value).where(counters.c.name.notin_(STATE_ROWS))
+        ).all())
+        # The DELETE takes the write lock, so no flush can slip in between counting and storing
+        conn.execute(delete(counters).where(counters.c.name.notin_(STATE_ROWS)))
+        actual = compute_counters(conn)
+        now = datetime.utcnow()
+        if actual:
+            conn.execute(insert(counters), [{'name': name, 'value': value, 'updated_at': now}
+                                            for name, value in actual.items()])
+        _refresh_leaders(conn)
+
+    return {name: (stored.get(name, 0), actual.get(name, 0))
+            for name in set(stored) | set(actual) if stored.get(name, 0) != actual.get(name, 0)}
+
+
+def needs_reconcile(engine):
+    """True when the counters have never been populated, or were by an older version"""
+    with engine.connect() as conn:
+        version = conn.execute(select(counters.c.value).where(counters.c.name == LEADERS)).scalar()
+    return version != COUNTERS_VERSION
+
+
+def load_metrics(session):
+    """Everything the /metrics page shows, read from the counter rows"""
+    rows = {row.name: row for row in session.query(MetricCounter).all()}
+    values = defaultdict(int, {name: row.value for name, row in rows.items()})
+
+    # Kept current by the flush hook; only missing before the first reconcile
+    leaders = json.loads(rows[LEADERS].data) if LEADERS in rows and rows[LEADERS].data else NO_LEADERS
+
+    today = date.today()
+    overdue_before = f'lent_active:{(today - timedelta(days=OVERDUE_DAYS)).isoformat()}'
+    first_month = f"lent_month:{(today - timedelta(days=365)):%Y-%m}"
+
+    monthly = sorted(
+        ((datetime.strptime(name.split(':', 1)[1], '%Y-%m'), value)
+         for name, value in values.items() if name.startswith('lent_month:') and name >= first_month and value),
+        reverse=True
+    )
+
+    return {
+        'values': values,
+        'category_counts': dict(sorted(
+            (name.split(':', 1)[1], value) for name, value in values.items()
+            if name.startswith('category:') and value > 0
+        )),
+        'overdue': sum(value for name, value in values.items()
+                       if name.startswith('lent_active:') and name < overdue_before),
+        'monthly_lendings': monthly,
+        'books_this_year': values[f'acquired:{today.year}'],
+        'avg_completion_time': values['reading_days'] / values['reading_days_count']
+                               if values['reading_days_count'] else 0,
+        'avg_lending_duration': values['lending_days'] / values['lending_days_count']
+                                if values['lending_days_count'] else 0,
+        'unique_borrowers': values['unique_borrowers'],
+        **{name: leaders.get(name) for name in NO_LEADERS},
+    }
@@ -97,14 +97,31 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=get_metadata(),
-            **conf_args
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        # The SQLite profile turns foreign keys on for every connection, and batch migrations
+        # rebuild a table by dropping it, which that refuses for tables others point at. The
+        # pragma is ignored inside a transaction, so switch it off before one starts
+        sqlite = connection.dialect.name == 'sqlite'
+        foreign_keys = sqlite and connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+        if foreign_keys:
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+
+        try:
+            context.configure(
+                connection=connection,
+                target_metadata=get_metadata(),
+                **conf_args
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+
+            if sqlite:
+                for table, rowid, parent, _ in connection.exec_driver_sql('PRAGMA foreign_key_check'):
+                    logger.warning('%s row %s points at a missing %s row', table, rowid, parent)
+        finally:
+            # The connection goes back to the pool, so leave it the way the profile set it up
+            if foreign_keys:
+                connection.exec_driver_sql('PRAGMA foreign_keys=ON')
 
 
 if context.is_offline_mode():
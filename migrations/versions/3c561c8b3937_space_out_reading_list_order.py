@@ -0,0 +1,41 @@
+"""Index reading list positions and space them out for gap-based ordering
+
+Revision ID: 3c561c8b3937
+Revises: 3f0ba4465444
+Create Date: 2026-10-18 16:02:41.517203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c561c8b3937'
+down_revision = '3f0ba4465444'
+branch_labels = None
+depends_on = None
+
+# Same as reading_order.ORDER_GAP at the time of this migration
+ORDER_GAP = 1024
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_reading_list_item_order_id' not in {index['name'] for index in inspector.get_indexes('reading_list_item')}:
+        op.create_index('ix_reading_list_item_order_id', 'reading_list_item', ['order', 'id'], unique=False)
+    # Existing positions are 1, 2, 3...; spread them out so moves have room in between
+    op.execute(
+        'UPDATE reading_list_item SET "order" = ranked.position * %d '
+        'FROM (SELECT id, row_number() OVER (ORDER BY "order", id) AS position FROM reading_list_item) AS ranked '
+        'WHERE ranked.id = reading_list_item.id' % ORDER_GAP
+    )
+
+
+def downgrade():
+    # Positions go back to 1, 2, 3... in the same order
+    op.execute(
+        'UPDATE reading_list_item SET "order" = ranked.position '
+        'FROM (SELECT id, row_number() OVER (ORDER BY "order", id) AS position FROM reading_list_item) AS ranked '
+        'WHERE ranked.id = reading_list_item.id'
+    )
+    op.drop_index('ix_reading_list_item_order_id', table_name='reading_list_item')
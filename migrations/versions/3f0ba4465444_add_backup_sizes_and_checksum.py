@@ -0,0 +1,31 @@
+"""Add raw size, checksum and duration to database backups
+
+Revision ID: 3f0ba4465444
+Revises: d99456ec3f79
+Create Date: 2026-10-18 14:02:31.417209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f0ba4465444'
+down_revision = 'd99456ec3f79'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Older uncompressed backups keep NULLs here
+    with op.batch_alter_table('database_backups', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('raw_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('checksum', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('duration', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('database_backups', schema=None) as batch_op:
+        batch_op.drop_column('duration')
+        batch_op.drop_column('checksum')
+        batch_op.drop_column('raw_size')
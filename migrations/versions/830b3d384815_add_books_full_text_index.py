@@ -0,0 +1,50 @@
+"""Add FTS5 full-text index over books
+
+Revision ID: 830b3d384815
+Revises: ebe3af61a05a
+Create Date: 2026-10-18 09:12:44.310517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '830b3d384815'
+down_revision = 'ebe3af61a05a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+        "title, author, isbn, categories, tags, "
+        "content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+        "INSERT INTO books_fts(rowid, title, author, isbn, categories, tags) "
+        "VALUES (new.id, new.title, new.author, new.isbn, new.categories, new.tags); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+        "INSERT INTO books_fts(books_fts, rowid, title, author, isbn, categories, tags) "
+        "VALUES ('delete', old.id, old.title, old.author, old.isbn, old.categories, old.tags); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, isbn, categories, tags ON books BEGIN "
+        "INSERT INTO books_fts(books_fts, rowid, title, author, isbn, categories, tags) "
+        "VALUES ('delete', old.id, old.title, old.author, old.isbn, old.categories, old.tags); "
+        "INSERT INTO books_fts(rowid, title, author, isbn, categories, tags) "
+        "VALUES (new.id, new.title, new.author, new.isbn, new.categories, new.tags); END"
+    )
+    # Index the existing catalog
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS books_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ai")
+    op.execute("DROP TABLE IF EXISTS books_fts")
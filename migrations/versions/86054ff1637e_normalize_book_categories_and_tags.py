@@ -0,0 +1,114 @@
+"""Normalize book categories and tags into link tables
+
+Revision ID: 86054ff1637e
+Revises: 830b3d384815
+Create Date: 2026-10-18 10:03:27.581964
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '86054ff1637e'
+down_revision = '830b3d384815'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def _split(value):
+    if not value:
+        return []
+    return list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+
+
+def _link(conn, name_table, link_table, fk, rows):
+    conn.execute(link_table.delete().where(link_table.c.book_id.in_([book_id for book_id, _ in rows])))
+    names = {name for _, book_names in rows for name in book_names}
+    if not names:
+        return
+
+    def lookup():
+        return dict(conn.execute(
+            sa.select(name_table.c.name, name_table.c.id).where(name_table.c.name.in_(names))
+        ).fetchall())
+
+    existing = lookup()
+    missing = [{'name': name} for name in names if name not in existing]
+    if missing:
+        conn.execute(name_table.insert(), missing)
+        existing = lookup()
+    links = [{'book_id': book_id, fk: existing[name]} for book_id, book_names in rows for name in book_names]
+    if links:
+        conn.execute(link_table.insert(), links)
+
+
+def upgrade():
+    conn = op.get_bind()
+    existing_tables = sa.inspect(conn).get_table_names()
+
+    # The app's create_all() may already have created these on startup
+    if 'categories' not in existing_tables:
+        op.create_table('categories',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=200), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+    if 'tags' not in existing_tables:
+        op.create_table('tags',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=200), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+    if 'book_categories' not in existing_tables:
+        op.create_table('book_categories',
+            sa.Column('book_id', sa.Integer(), nullable=False),
+            sa.Column('category_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('book_id', 'category_id')
+        )
+        op.create_index('ix_book_categories_category_id', 'book_categories', ['category_id', 'book_id'])
+    if 'book_tags' not in existing_tables:
+        op.create_table('book_tags',
+            sa.Column('book_id', sa.Integer(), nullable=False),
+            sa.Column('tag_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('book_id', 'tag_id')
+        )
+        op.create_index('ix_book_tags_tag_id', 'book_tags', ['tag_id', 'book_id'])
+
+    # Convert the comma-separated strings in batches so large libraries don't build one giant statement
+    books = sa.table('books', sa.column('id'), sa.column('categories'), sa.column('tags'))
+    categories = sa.table('categories', sa.column('id'), sa.column('name'))
+    tags = sa.table('tags', sa.column('id'), sa.column('name'))
+    book_categories = sa.table('book_categories', sa.column('book_id'), sa.column('category_id'))
+    book_tags = sa.table('book_tags', sa.column('book_id'), sa.column('tag_id'))
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(books.c.id, books.c.categories, books.c.tags)
+            .where(books.c.id > last_id)
+            .order_by(books.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        _link(conn, categories, book_categories, 'category_id', [(row[0], _split(row[1])) for row in rows])
+        _link(conn, tags, book_tags, 'tag_id', [(row[0], _split(row[2])) for row in rows])
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    op.drop_index('ix_book_tags_tag_id', table_name='book_tags')
+    op.drop_table('book_tags')
+    op.drop_index('ix_book_categories_category_id', table_name='book_categories')
+    op.drop_table('book_categories')
+    op.drop_table('tags')
+    op.drop_table('categories')
@@ -0,0 +1,33 @@
+"""Add metric counters
+
+Revision ID: a5f3a138e76b
+Revises: d56da959ce80
+Create Date: 2026-10-18 12:02:44.106529
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5f3a138e76b'
+down_revision = 'd56da959ce80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all() may already have created it on startup; either way the
+    # counters are filled in by the app the first time it finds the table empty
+    if 'metric_counters' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('metric_counters',
+            sa.Column('name', sa.String(length=200), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.Column('data', sa.Text(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade():
+    op.drop_table('metric_counters')
@@ -0,0 +1,39 @@
+"""Never reuse request log ids
+
+Revision ID: b7e21c4d9a06
+Revises: d30f370e206f
+Create Date: 2026-10-18 21:05:37.481902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e21c4d9a06'
+down_revision = 'd30f370e206f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rollups only pick up request logs above the watermark id, and without AUTOINCREMENT
+    # SQLite starts handing out ids from 1 again once retention has emptied the table
+    with op.batch_alter_table('request_logs', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        pass
+
+    # Carry on numbering above both the rows left and the watermark
+    watermark = "COALESCE((SELECT value FROM metric_counters WHERE name = 'request_rollup_watermark'), 0)"
+    op.execute(f"""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'request_logs', MAX(COALESCE((SELECT MAX(id) FROM request_logs), 0), {watermark})
+        WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'request_logs')
+    """)
+    op.execute(f"UPDATE sqlite_sequence SET seq = MAX(seq, {watermark}) WHERE name = 'request_logs'")
+
+
+def downgrade():
+    with op.batch_alter_table('request_logs', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+        pass
@@ -0,0 +1,55 @@
+"""Index ISBNs without hyphens in the full-text index
+
+Revision ID: d30f370e206f
+Revises: 3c561c8b3937
+Create Date: 2026-10-18 20:14:09.127530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd30f370e206f'
+down_revision = '3c561c8b3937'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'title, author, isbn, categories, tags'
+
+
+def create_triggers(isbn):
+    """FTS triggers indexing `isbn` (an SQL expression over {row}) for the isbn column"""
+    new = f"new.title, new.author, {isbn.format(row='new')}, new.categories, new.tags"
+    old = f"old.title, old.author, {isbn.format(row='old')}, old.categories, old.tags"
+    for trigger in ('books_fts_au', 'books_fts_ad', 'books_fts_ai'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute(
+        f"CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN "
+        f"INSERT INTO books_fts(rowid, {COLUMNS}) VALUES (new.id, {new}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN "
+        f"INSERT INTO books_fts(books_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {old}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER books_fts_au AFTER UPDATE OF {COLUMNS} ON books BEGIN "
+        f"INSERT INTO books_fts(books_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO books_fts(rowid, {COLUMNS}) VALUES (new.id, {new}); END"
+    )
+
+
+def upgrade():
+    create_triggers("replace(replace({row}.isbn, '-', ''), ' ', '')")
+    # FTS5's 'rebuild' would read the hyphenated ISBNs straight from books, so refill by hand
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('delete-all')")
+    op.execute(
+        f"INSERT INTO books_fts(rowid, {COLUMNS}) "
+        f"SELECT id, title, author, replace(replace(isbn, '-', ''), ' ', ''), categories, tags FROM books"
+    )
+
+
+def downgrade():
+    create_triggers("{row}.isbn")
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('delete-all')")
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
@@ -0,0 +1,90 @@
+"""Add current lending pointer to books
+
+Revision ID: d56da959ce80
+Revises: 86054ff1637e
+Create Date: 2026-10-18 11:20:05.418273
+
+"""
+from contextlib import contextmanager
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd56da959ce80'
+down_revision = '86054ff1637e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Older re-lendings could leave several open records per book; keep the newest one open
+    # and close the others on the date it was lent, so the unique index below can be built
+    op.execute("""
+        UPDATE book_lending
+        SET return_date = (
+            SELECT newest.lent_date FROM book_lending AS newest
+            WHERE newest.id = (
+                SELECT MAX(other.id) FROM book_lending AS other
+                WHERE other.book_id = book_lending.book_id
+                  AND other.return_date IS NULL AND other.deleted = 0
+            )
+        )
+        WHERE return_date IS NULL AND deleted = 0
+          AND id NOT IN (
+              SELECT MAX(id) FROM book_lending
+              WHERE return_date IS NULL AND deleted = 0
+              GROUP BY book_id
+          )
+    """)
+    op.create_index('uq_book_lending_active_book_id', 'book_lending', ['book_id'], unique=True,
+                    sqlite_where=sa.text('return_date IS NULL AND deleted = 0'))
+
+    # Plain ADD COLUMNs rather than a batch copy of books, which lendings, reading list items
+    # and the category/tag links all point at. SQLite can't add a foreign key on its own, but
+    # it can add a column that carries one
+    op.execute("""
+        ALTER TABLE books ADD COLUMN current_lending_id INTEGER
+        CONSTRAINT fk_books_current_lending_id REFERENCES book_lending (id)
+    """)
+    op.add_column('books', sa.Column('is_lent', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    op.execute("""
+        UPDATE books
+        SET current_lending_id = (
+            SELECT id FROM book_lending
+            WHERE book_lending.book_id = books.id
+              AND return_date IS NULL AND deleted = 0
+        )
+    """)
+    op.execute("UPDATE books SET is_lent = (current_lending_id IS NOT NULL)")
+
+
+@contextmanager
+def foreign_keys_off():
+    """Rebuild a table others reference without SQLite refusing to drop the old copy"""
+    bind = op.get_bind()
+    enabled = bind.exec_driver_sql('PRAGMA foreign_keys').scalar()
+    bind.exec_driver_sql('PRAGMA foreign_keys=OFF')
+    try:
+        # Databases from before foreign keys were enforced may already have dangling rows;
+        # only complain about ones the rebuild added
+        before = len(bind.exec_driver_sql('PRAGMA foreign_key_check').fetchall())
+        yield
+        after = len(bind.exec_driver_sql('PRAGMA foreign_key_check').fetchall())
+        if after > before:
+            raise RuntimeError(f'Rebuilding books left {after - before} new dangling references')
+    finally:
+        if enabled:
+            bind.exec_driver_sql('PRAGMA foreign_keys=ON')
+
+
+def downgrade():
+    # Dropping a column that has a foreign key needs the batch copy, and so the guard above;
+    # the constraint goes with the column
+    with foreign_keys_off(), op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_column('is_lent')
+        batch_op.drop_column('current_lending_id')
+
+    op.drop_index('uq_book_lending_active_book_id', table_name='book_lending')
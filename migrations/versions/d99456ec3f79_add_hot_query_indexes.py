@@ -0,0 +1,44 @@
+"""Add indexes for the hot listing and lookup queries
+
+Revision ID: d99456ec3f79
+Revises: fcc021bcb1cd
+Create Date: 2026-10-18 13:15:52.804116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd99456ec3f79'
+down_revision = 'fcc021bcb1cd'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial index WHERE clause)
+INDEXES = [
+    ('ix_books_deleted_title', 'books', ['deleted', 'title', 'id'], None),
+    ('ix_books_active_isbn_copy_number', 'books', ['isbn', 'copy_number'], 'deleted = 0'),
+    ('ix_books_trash_deleted_at', 'books', ['deleted_at'], 'deleted = 1'),
+    ('ix_book_lending_book_id_lent_date', 'book_lending', ['book_id', 'lent_date'], None),
+    ('ix_book_lending_lent_date_id', 'book_lending', ['lent_date', 'id'], None),
+    ('ix_book_lending_trash_deleted_at', 'book_lending', ['deleted_at'], 'deleted = 1'),
+    ('ix_reading_list_item_book_id', 'reading_list_item', ['book_id'], None),
+    ('ix_request_logs_timestamp_id', 'request_logs', ['timestamp', 'id'], None),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns, where in INDEXES:
+        # create_all() adds these itself when it creates a table from scratch
+        if name in {index['name'] for index in inspector.get_indexes(table)}:
+            continue
+        op.create_index(name, table, columns, unique=False,
+                        sqlite_where=sa.text(where) if where else None)
+    op.execute('ANALYZE')
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
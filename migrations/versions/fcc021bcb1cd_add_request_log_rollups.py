@@ -0,0 +1,44 @@
+"""Add request log rollups
+
+Revision ID: fcc021bcb1cd
+Revises: a5f3a138e76b
+Create Date: 2026-10-18 12:41:09.552318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fcc021bcb1cd'
+down_revision = 'a5f3a138e76b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all() may already have created it on startup; the compaction job
+    # rolls up the existing request logs on its first run
+    if 'request_log_rollups' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('request_log_rollups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('resolution', sa.String(length=10), nullable=False),
+            sa.Column('bucket_start', sa.DateTime(), nullable=False),
+            sa.Column('endpoint', sa.String(length=500), nullable=False),
+            sa.Column('method', sa.String(length=10), nullable=False),
+            sa.Column('status_code', sa.Integer(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('total_time', sa.Float(), nullable=False),
+            sa.Column('max_time', sa.Float(), nullable=False),
+            sa.Column('p50', sa.Float(), nullable=True),
+            sa.Column('p95', sa.Float(), nullable=True),
+            sa.Column('p99', sa.Float(), nullable=True),
+            sa.Column('histogram', sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('resolution', 'bucket_start', 'endpoint', 'method', 'status_code',
+                                name='uq_request_log_rollups_bucket')
+        )
+
+
+def downgrade():
+    op.drop_table('request_log_rollups')
@@ -1,11 +1,77 @@
+import threading
+import weakref
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import Index
+from sqlalchemy import Index, text
 
-db = SQLAlchemy()
+
+class LibrarySQLAlchemy(SQLAlchemy):
+    """SQLAlchemy that runs the `on_engine` callbacks once for each engine it creates.
+
+    Flask-SQLAlchemy builds engines lazily (and again when the URI changes), so this is
+    where per-connection setup has to hook in to be there before the first connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._engine_callbacks = []
+        self._prepared_engines = weakref.WeakSet()
+        self._prepare_lock = threading.Lock()
+
+    def on_engine(self, callback):
+        """Register `callback(app, engine)`; usable as a decorator"""
+        self._engine_callbacks.append(callback)
+        return callback
+
+    def get_engine(self, app=None, bind=None):
+        engine = super().get_engine(app, bind)
+        if engine not in self._prepared_engines:
+            with self._prepare_lock:
+                if engine not in self._prepared_engines:
+                    for callback in self._engine_callbacks:
+                        callback(self.get_app(app), engine)
+                    self._prepared_engines.add(engine)
+        return engine
+
+
+db = LibrarySQLAlchemy()
+
+# Many-to-many links between books and their categories/tags; the comma-separated
+# Book.categories/Book.tags strings stay as the display copy and are synced into these
+book_categories = db.Table(
+    'book_categories',
+    db.Column('book_id', db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('category_id', db.Integer, db.ForeignKey('categories.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_book_categories_category_id', 'category_id', 'book_id')
+)
+
+book_tags = db.Table(
+    'book_tags',
+    db.Column('book_id', db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_book_tags_tag_id', 'tag_id', 'book_id')
+)
+
+class Category(db.Model):
+    __tablename__ = 'categories'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False, unique=True)
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False, unique=True)
 
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        # Catalog listing (deleted = 0 in title order) and its count, both index-only
+        Index('ix_books_deleted_title', 'deleted', 'title', 'id'),
+        # Next copy number for an ISBN
+        Index('ix_books_active_isbn_copy_number', 'isbn', 'copy_number', sqlite_where=text('deleted = 0')),
+        # Trash, newest first
+        Index('ix_books_trash_deleted_at', 'deleted_at', sqlite_where=text('deleted = 1')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(200), nullable=False)
@@ -18,15 +84,35 @@ class Book(db.Model):
     categories = db.Column(db.String(500))
     tags = db.Column(db.String(500))
     notes = db.Column(db.Text)
-    lendings = db.relationship('BookLending', backref='book', lazy=True)
+    lendings = db.relationship('BookLending', backref='book', lazy=True, foreign_keys='BookLending.book_id')
     reading_list_items = db.relationship('ReadingListItem', backref='book', lazy=True)
     deleted = db.Column(db.Boolean, default=False)
     deleted_at = db.Column(db.DateTime, nullable=True)
     read = db.Column(db.Boolean, default=False)
     read_date = db.Column(db.Date, nullable=True)
+    category_entries = db.relationship('Category', secondary=book_categories, lazy='select',
+                                       backref=db.backref('books', lazy='dynamic'))
+    tag_entries = db.relationship('Tag', secondary=book_tags, lazy='select',
+                                  backref=db.backref('books', lazy='dynamic'))
+    # Denormalized lending status, kept up to date by the lending routes (see refresh_lending_state)
+    current_lending_id = db.Column(db.Integer, db.ForeignKey('book_lending.id', use_alter=True,
+                                                             name='fk_books_current_lending_id'), nullable=True)
+    is_lent = db.Column(db.Boolean, default=False, nullable=False)
+    current_lending = db.relationship('BookLending', foreign_keys=[current_lending_id], post_update=True)
 
 class BookLending(db.Model):
     __tablename__ = 'book_lending'
+    __table_args__ = (
+        # A book can only have one open (unreturned, not deleted) lending at a time
+        Index('uq_book_lending_active_book_id', 'book_id', unique=True,
+              sqlite_where=text('return_date IS NULL AND deleted = 0')),
+        # One book's lending history newest first; also covers counting the lending/book join
+        Index('ix_book_lending_book_id_lent_date', 'book_id', 'lent_date'),
+        # Lending history across all books, newest first
+        Index('ix_book_lending_lent_date_id', 'lent_date', 'id'),
+        # Trash, newest first
+        Index('ix_book_lending_trash_deleted_at', 'deleted_at', sqlite_where=text('deleted = 1')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
     borrower_name = db.Column(db.String(100), nullable=False)
@@ -38,9 +124,14 @@ class BookLending(db.Model):
     deleted_at = db.Column(db.DateTime, nullable=True)
 
 class ReadingListItem(db.Model):
+    __table_args__ = (
+        Index('ix_reading_list_item_book_id', 'book_id'),
+        # Appends read max(order), moves look up the neighbouring positions
+        Index('ix_reading_list_item_order_id', 'order', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
-    order = db.Column(db.Integer, nullable=False)
+    order = db.Column(db.Integer, nullable=False)  # sparse position, see reading_order.py
     added_date = db.Column(db.Date, nullable=False, default=datetime.now().date())
     notes = db.Column(db.Text)
     completed = db.Column(db.Boolean, default=False)
@@ -48,6 +139,13 @@ class ReadingListItem(db.Model):
 
 class RequestLog(db.Model):
     __tablename__ = 'request_logs'
+    __table_args__ = (
+        # Admin log view (newest first) and the retention deletes
+        Index('ix_request_logs_timestamp_id', 'timestamp', 'id'),
+        # The rollup watermark is an id, so ids must never be reused once retention has
+        # emptied the table
+        {'sqlite_autoincrement': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     method = db.Column(db.String(10))
@@ -58,11 +156,43 @@ class RequestLog(db.Model):
     user_agent = db.Column(db.String(500))
     response_time = db.Column(db.Float)
 
+class RequestLogRollup(db.Model):
+    """Request count and latency for one endpoint/method/status over a minute, hour or day"""
+    __tablename__ = 'request_log_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'bucket_start', 'endpoint', 'method', 'status_code',
+                            name='uq_request_log_rollups_bucket'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(10), nullable=False)  # minute, hour or day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    endpoint = db.Column(db.String(500), nullable=False, default='')
+    method = db.Column(db.String(10), nullable=False, default='')
+    status_code = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_time = db.Column(db.Float, nullable=False, default=0)  # seconds
+    max_time = db.Column(db.Float, nullable=False, default=0)
+    p50 = db.Column(db.Float)
+    p95 = db.Column(db.Float)
+    p99 = db.Column(db.Float)
+    histogram = db.Column(db.Text)  # JSON counts per rollups.LATENCY_BOUNDS_MS bucket
+
 class DatabaseBackup(db.Model):
     __tablename__ = 'database_backups'
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    size = db.Column(db.Integer)  # in bytes
+    size = db.Column(db.Integer)  # bytes this backup added to the backups folder
+    raw_size = db.Column(db.Integer)  # uncompressed database size in bytes
+    checksum = db.Column(db.String(64))  # sha256 of the uncompressed database
+    duration = db.Column(db.Float)  # seconds taken to snapshot and compress
     scheduled = db.Column(db.Boolean, default=False)
-    notes = db.Column(db.Text) 
\ No newline at end of file
+    notes = db.Column(db.Text) 
+
+class MetricCounter(db.Model):
+    """Precomputed /metrics numbers, kept up to date by metrics_store"""
+    __tablename__ = 'metric_counters'
+    name = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    data = db.Column(db.Text)  # JSON, for the rows that hold more than a number
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
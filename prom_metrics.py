@@ -0,0 +1,192 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+# Default latency buckets (seconds), roughly the ones prometheus_client ships with
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Child:
+    """One label combination's samples; each child has its own lock so threads rarely contend"""
+
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _child(self, labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        return _Child(0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, child in sorted(self._children.items()):
+            with child.lock:
+                lines.extend(self._samples(key, child))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        child = self._child(labels)
+        with child.lock:
+            child.sum += amount
+
+    def _samples(self, key, child):
+        return [f'{self.name}{_labels(self.labelnames, key)} {_number(child.sum)}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Child(len(self.bounds) + 1)
+
+    def observe(self, value, **labels):
+        child = self._child(labels)
+        index = bisect_left(self.bounds, value)
+        with child.lock:
+            child.buckets[index] += 1
+            child.sum += value
+            child.count += 1
+
+    def _samples(self, key, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), child.buckets):
+            cumulative += count
+            le = 'le="%s"' % _number(bound)
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(child.sum)}')
+        lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {child.count}')
+        return lines
+
+
+class CallbackMetric:
+    """Counter or gauge whose samples come from a function at scrape time, for stats kept elsewhere"""
+
+    def __init__(self, name, help, kind, labelnames, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self.collect().items()):
+            if value is not None:
+                lines.append(f'{self.name}{_labels(self.labelnames, key)} {_number(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.add(Histogram(
+    'library_request_duration_seconds', 'Time spent handling requests', ('endpoint', 'method')))
+REQUESTS = registry.add(Counter(
+    'library_requests_total', 'Requests handled', ('endpoint', 'method', 'status')))
+REQUEST_DB_TIME = registry.add(Histogram(
+    'library_request_db_seconds', 'Time spent in database queries per request', ('endpoint',)))
+DB_QUERY_LATENCY = registry.add(Histogram(
+    'library_db_query_duration_seconds', 'Database statement execution time', ('statement',)))
+PROVIDER_LATENCY = registry.add(Histogram(
+    'library_provider_request_duration_seconds', 'Metadata provider HTTP request time', ('provider', 'outcome')))
+
+
+def observe_request(endpoint, method, status_code, seconds):
+    endpoint = endpoint or 'unknown'
+    REQUEST_LATENCY.observe(seconds, endpoint=endpoint, method=method)
+    REQUESTS.inc(endpoint=endpoint, method=method, status=status_code)
+    REQUEST_DB_TIME.observe(g.get('db_time', 0.0), endpoint=endpoint)
+
+
+def observe_provider(provider, seconds, outcome='ok'):
+    PROVIDER_LATENCY.observe(seconds, provider=provider, outcome=outcome)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start_time', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    if keyword not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+        keyword = 'OTHER'
+    DB_QUERY_LATENCY.observe(elapsed, statement=keyword)
+    if has_request_context():
+        g.db_time = g.get('db_time', 0.0) + elapsed
+
+
+def instrument_engine(engine):
+    """Time every statement run through `engine`, overall and per request"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,136 @@
+import os
+import random
+import re
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, insert
+
+from models import db, Book, BookLending, ReadingListItem, RequestLog
+from search_index import create_search_index
+from reading_order import ORDER_GAP
+from taxonomy import backfill_taxonomy
+
+# Tables a hot query may read in full: small lookup tables and ones read whole by design
+ALLOWED_SCANS = {'categories', 'tags', 'database_backups', 'metric_counters', 'books_fts'}
+
+SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+@contextmanager
+def temporary_database(app):
+    """Point the app at a fresh SQLite file for the duration of the block"""
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='query-plans-')
+    os.close(fd)
+    original = app.config['SQLALCHEMY_DATABASE_URI']
+    db.session.remove()
+    # Flask-SQLAlchemy builds a new engine when the configured URI changes
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    try:
+        yield db.get_engine(app)
+    finally:
+        db.session.remove()
+        db.get_engine(app).dispose()
+        app.config['SQLALCHEMY_DATABASE_URI'] = original
+        os.remove(path)
+
+
+def seed(engine, books=2000, lendings=3000, logs=5000):
+    """Fill an empty schema with enough rows that the planner's choices mean something"""
+    rng = random.Random(42)
+    categories = ['Fiction', 'History', 'Science', 'Poetry', 'Biography', 'Sci-Fi', 'Fantasy']
+    today = date.today()
+    now = datetime.utcnow()
+
+    db.Model.metadata.create_all(engine)
+    create_search_index(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Book.__table__), [{
+            'title': f'Book {i:05d}',
+            'author': f'Author {i % 300}',
+            'isbn': f'978{i:010d}',
+            'copy_number': 1,
+            'pages': rng.randint(80, 900),
+            'acquisition_date': today - timedelta(days=rng.randint(0, 2000)),
+            'categories': ', '.join(rng.sample(categories, 2)),
+            'tags': '',
+            'deleted': i % 20 == 0,
+            'deleted_at': now - timedelta(days=i % 90) if i % 20 == 0 else None,
+            'read': i % 3 == 0,
+            'is_lent': False,
+        } for i in range(1, books + 1)])
+        rows = []
+        for i in range(lendings):
+            lent = today - timedelta(days=rng.randint(0, 1500))
+            rows.append({
+                'book_id': (i % books) + 1,
+                'borrower_name': f'Borrower {i % 150}',
+                'lent_date': lent,
+                'due_date': lent + timedelta(days=14),
+                # Only the last lending of a book can still be open
+                'return_date': None if i >= lendings - books // 10 else lent + timedelta(days=rng.randint(1, 60)),
+                'deleted': False,
+            })
+        conn.execute(insert(BookLending.__table__), rows)
+        conn.execute(insert(ReadingListItem.__table__), [{
+            'book_id': rng.randint(1, books), 'order': (i + 1) * ORDER_GAP,
+            'added_date': today - timedelta(days=rng.randint(0, 700)), 'completed': i % 2 == 0,
+        } for i in range(300)])
+        conn.execute(insert(RequestLog.__table__), [{
+            'timestamp': now - timedelta(seconds=i * 30), 'method': 'GET', 'path': '/',
+            'endpoint': 'index', 'status_code': 200 if i % 25 else 500, 'ip_address': '127.0.0.1',
+            'user_agent': 'seed', 'response_time': rng.random() / 10,
+        } for i in range(logs)])
+    backfill_taxonomy(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+
+
+@contextmanager
+def capture_statements(engine):
+    """Collect the (sql, parameters) of every SELECT run through `engine`"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def explain(engine, statement, parameters):
+    with engine.connect() as conn:
+        return [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+
+
+def full_scans(plan, tables):
+    """Tables the plan reads without any index"""
+    scanned = []
+    for detail in plan:
+        match = SCAN.match(detail)
+        if match and match.group(1) in tables and match.group(1) not in ALLOWED_SCANS:
+            scanned.append(match.group(1))
+    return scanned
+
+
+def check(engine, statements):
+    """Return [(sql, plan, scanned tables)] for the captured statements that fall back to a full scan"""
+    with engine.connect() as conn:
+        tables = {name for name, in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    failures = []
+    seen = set()
+    for statement, parameters in statements:
+        key = (statement, tuple(parameters))
+        if key in seen:
+            continue
+        seen.add(key)
+        plan = explain(engine, statement, parameters)
+        scanned = full_scans(plan, tables)
+        if scanned:
+            failures.append((statement, plan, scanned))
+    return failures
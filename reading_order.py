@@ -0,0 +1,65 @@
+from sqlalchemy import func, text
+
+from models import ReadingListItem
+
+# Reading list positions are spaced this far apart, so an item can be moved between two
+# others by giving it the midpoint, without touching any other row
+ORDER_GAP = 1024
+
+# Respace every item ORDER_GAP apart in its current order, in one statement
+REBALANCE = text(
+    'UPDATE reading_list_item SET "order" = ranked.position * :gap '
+    'FROM (SELECT id, row_number() OVER (ORDER BY "order", id) AS position FROM reading_list_item) AS ranked '
+    'WHERE ranked.id = reading_list_item.id'
+)
+
+
+def next_order(session):
+    """Position for an item appended to the end of the list (max() reads the order index)"""
+    last = session.query(func.max(ReadingListItem.order)).scalar()
+    return (last or 0) + ORDER_GAP
+
+
+def rebalance(session):
+    session.flush()
+    session.execute(REBALANCE, {'gap': ORDER_GAP})
+    session.expire_all()
+
+
+def _neighbours(session, item, after, before):
+    others = session.query(ReadingListItem.order).filter(ReadingListItem.id != item.id)
+    if after is not None:
+        low = after.order
+        high = others.filter(ReadingListItem.order > low).order_by(ReadingListItem.order).limit(1).scalar()
+    elif before is not None:
+        high = before.order
+        low = others.filter(ReadingListItem.order < high).order_by(ReadingListItem.order.desc()).limit(1).scalar()
+    else:
+        return None, None
+    return low, high
+
+
+def move_item(session, item, after_id=None, before_id=None):
+    """Place `item` right after `after_id` (or right before `before_id`), rewriting only its row.
+
+    Positions stay above zero; when two neighbours have no room left between them the
+    whole list is respaced first. Returns the item's new position, or None if nothing moved.
+    """
+    for attempt in range(2):
+        after = session.get(ReadingListItem, after_id) if after_id else None
+        before = session.get(ReadingListItem, before_id) if before_id else None
+        if after is None and before is None:
+            return None
+        low, high = _neighbours(session, item, after, before)
+        low = low or 0
+        if high is None:
+            position = low + ORDER_GAP
+        elif high - low >= 2:
+            position = (low + high) // 2
+        elif attempt == 0:
+            rebalance(session)
+            continue
+        else:
+            return None
+        item.order = position
+        return position
@@ -0,0 +1,141 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import insert
+
+from models import db, RequestLog, MetricCounter
+from metrics_store import apply_deltas, request_counts
+from response_cache import versions
+
+
+class RequestLogWriter:
+    """Buffers RequestLog rows in memory and bulk-inserts them from a background thread.
+
+    Requests only pay for a `put_nowait` on a bounded queue. The writer thread
+    inserts whatever has queued up every `flush_interval` seconds, or as soon as
+    `batch_size` rows are waiting, in one transaction per batch. When the queue
+    is full new records are dropped and counted rather than blocking the request.
+
+    `sample_rate` keeps that fraction of successful requests (errors are always
+    logged) and endpoints in `exclude_endpoints` are never logged.
+    """
+
+    def __init__(self, app, max_queue=10000, batch_size=500, flush_interval=0.5,
+                 sample_rate=1.0, exclude_endpoints=()):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.exclude_endpoints = set(exclude_endpoints)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stats = Counter()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def should_log(self, endpoint, status_code):
+        if endpoint in self.exclude_endpoints:
+            return False
+        if status_code >= 400 or self.sample_rate >= 1:
+            return True
+        return random.random() < self.sample_rate
+
+    def log(self, **record):
+        """Queue one RequestLog row (as column values); returns False if it was dropped"""
+        if not self.should_log(record.get('endpoint'), record.get('status_code') or 0):
+            self._count('skipped')
+            return False
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        return True
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give a burst a moment to fill the batch instead of writing rows one by one
+            deadline = time.monotonic() + self.flush_interval
+            while self.queue.qsize() < self.batch_size - 1 and time.monotonic() < deadline:
+                time.sleep(min(0.05, self.flush_interval))
+            self._write(self._drain(first))
+
+    def _write(self, batch):
+        if not batch:
+            return
+        deltas = Counter()
+        for record in batch:
+            deltas.update(request_counts(record.get('method'), record.get('status_code')))
+        with self._write_lock:
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        conn.execute(insert(RequestLog.__table__), batch)
+                        # Core inserts skip the session hooks, so update the /metrics counters here
+                        apply_deltas(conn, deltas)
+                versions.bump(RequestLog.__tablename__, MetricCounter.__tablename__)
+                self._count('written', len(batch))
+                self._count('batches')
+            except Exception as e:
+                self._count('failed', len(batch))
+                logging.error(f"Failed to write {len(batch)} request logs: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+        # The background thread may be partway through a batch it already took off the queue
+        self.queue.join()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        for key in ('written', 'batches', 'dropped', 'skipped', 'failed'):
+            stats.setdefault(key, 0)
+        stats['queued'] = self.queue.qsize()
+        stats['max_queue'] = self.queue.maxsize
+        stats['sample_rate'] = self.sample_rate
+        stats['exclude_endpoints'] = sorted(self.exclude_endpoints)
+        return stats
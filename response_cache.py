@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# A rendered page as it's kept in the cache: the body plus what's needed to send it again
+CachedPage = namedtuple('CachedPage', 'body content_type etag')
+
+
+class DataVersions:
+    """A change counter per table, bumped when a transaction that wrote the table commits.
+
+    ORM changes are picked up from session flushes; writes that bypass the session (core
+    inserts from the request log writer, compaction) call bump() themselves. Counters are
+    per process, so changes made by another process only show up through the cache TTL.
+    """
+
+    def __init__(self):
+        self._versions = Counter()
+        self._lock = threading.Lock()
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+
+    def snapshot(self, tables):
+        with self._lock:
+            return tuple(self._versions[table] for table in tables)
+
+    def _after_flush(self, session, flush_context):
+        touched = session.info.setdefault('changed_tables', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            mapper = inspect(obj).mapper
+            touched.update(table.name for table in mapper.tables)
+            # Collections written through a link table (Book.category_entries and friends)
+            for relationship in mapper.relationships:
+                if relationship.secondary is not None:
+                    touched.add(relationship.secondary.name)
+
+    def _after_commit(self, session):
+        touched = session.info.pop('changed_tables', None)
+        if touched:
+            self.bump(*touched)
+
+    def _after_rollback(self, session):
+        session.info.pop('changed_tables', None)
+
+
+# One set of counters per process, since every app in it shares the models' sessions
+versions = DataVersions()
+
+
+def _size(value):
+    """Rough bytes held by a cached value, for the memory bound"""
+    if isinstance(value, CachedPage):
+        return len(value.body) + len(value.etag) + len(value.content_type)
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return 8 * len(value) + sum(_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_size(k) + _size(v) for k, v in value.items())
+    return 16
+
+
+class ResponseCache:
+    """LRU cache of rendered pages and page fragments, bounded by total size.
+
+    Every entry is stamped with the versions of the tables it was built from and counts
+    as a miss once any of them has moved on, or after `ttl` seconds at the latest. The
+    stamp is taken before building, so a commit that lands mid-render makes the new
+    entry stale instead of wrong.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=2048, ttl=300, data_versions=versions):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.versions = data_versions
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = Counter({'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'bypassed': 0,
+                               'not_modified': 0})
+
+    def lookup(self, key, tables):
+        """(value, stamp) for `key`, with value None on a miss; pass the stamp to store()"""
+        stamp = self.versions.snapshot(tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None, stamp
+            if entry[0] != stamp or entry[1] <= now:
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                self._remove(key)
+                return None, stamp
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[2], stamp
+
+    def store(self, key, stamp, value):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (stamp, time.monotonic() + self.ttl, value, size)
+            self._bytes += size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def get(self, key, tables, build):
+        """The cached value for `key`, built (and kept) by `build()` on a miss"""
+        value, stamp = self.lookup(key, tables)
+        if value is None:
+            value = build()
+            self.store(key, stamp, value)
+        return value
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['max_bytes'] = self.max_bytes
+        stats['max_entries'] = self.max_entries
+        return stats
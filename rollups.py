@@ -0,0 +1,226 @@
+import json
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, update, insert, bindparam
+
+from models import RequestLog, RequestLogRollup, MetricCounter
+
+# Upper bounds (ms) of the latency histogram buckets; one more bucket holds everything slower
+LATENCY_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+RESOLUTIONS = ('minute', 'hour', 'day')
+
+# Highest RequestLog.id already folded into the rollups, kept in the metric_counters table
+WATERMARK = 'request_rollup_watermark'
+
+logs = RequestLog.__table__
+rollups = RequestLogRollup.__table__
+counters = MetricCounter.__table__
+
+
+def bucket_start(timestamp, resolution):
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def merge_histograms(a, b):
+    return [x + y for x, y in zip(a, b)]
+
+
+def percentile(histogram, q, max_time=None):
+    """Approximate q-quantile (seconds) as the upper bound of the bucket it falls in"""
+    total = sum(histogram)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= target:
+            if i < len(LATENCY_BOUNDS_MS):
+                bound = LATENCY_BOUNDS_MS[i] / 1000
+                return min(bound, max_time) if max_time else bound
+            return max_time
+    return max_time
+
+
+class Bucket:
+    __slots__ = ('id', 'count', 'total_time', 'max_time', 'histogram')
+
+    def __init__(self, id=None, count=0, total_time=0.0, max_time=0.0, histogram=None):
+        self.id = id
+        self.count = count
+        self.total_time = total_time
+        self.max_time = max_time
+        self.histogram = histogram or [0] * (len(LATENCY_BOUNDS_MS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+        self.histogram[bisect_left(LATENCY_BOUNDS_MS, seconds * 1000)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.histogram = merge_histograms(self.histogram, other.histogram)
+
+    def values(self):
+        return {
+            'count': self.count,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            'p50': percentile(self.histogram, 0.50, self.max_time),
+            'p95': percentile(self.histogram, 0.95, self.max_time),
+            'p99': percentile(self.histogram, 0.99, self.max_time),
+            'histogram': json.dumps(self.histogram),
+        }
+
+
+def get_watermark(conn):
+    return conn.execute(select(counters.c.value).where(counters.c.name == WATERMARK)).scalar() or 0
+
+
+def _set_watermark(conn, log_id):
+    if conn.execute(update(counters).where(counters.c.name == WATERMARK).values(
+            value=log_id, updated_at=datetime.utcnow())).rowcount == 0:
+        conn.execute(insert(counters).values(name=WATERMARK, value=log_id, updated_at=datetime.utcnow()))
+
+
+def _fold(conn, rows):
+    """Add raw log rows to their minute/hour/day buckets, merging with the stored ones"""
+    batch = defaultdict(Bucket)
+    for row in rows:
+        for resolution in RESOLUTIONS:
+            key = (resolution, bucket_start(row.timestamp, resolution),
+                   row.endpoint or '', row.method or '', row.status_code or 0)
+            batch[key].add(row.response_time or 0.0)
+
+    existing = {}
+    for resolution in RESOLUTIONS:
+        starts = [key[1] for key in batch if key[0] == resolution]
+        for row in conn.execute(select(rollups).where(
+            rollups.c.resolution == resolution,
+            rollups.c.bucket_start.between(min(starts), max(starts))
+        )):
+            existing[(row.resolution, row.bucket_start, row.endpoint, row.method, row.status_code)] = Bucket(
+                row.id, row.count, row.total_time, row.max_time, json.loads(row.histogram))
+
+    inserts, updates = [], []
+    for key, bucket in batch.items():
+        stored = existing.get(key)
+        if stored:
+            stored.merge(bucket)
+            updates.append({'rollup_id': stored.id, **stored.values()})
+        else:
+            resolution, start, endpoint, method, status_code = key
+            inserts.append({'resolution': resolution, 'bucket_start': start, 'endpoint': endpoint,
+                            'method': method, 'status_code': status_code, **bucket.values()})
+    if inserts:
+        conn.execute(insert(rollups), inserts)
+    if updates:
+        conn.execute(
+            update(rollups).where(rollups.c.id == bindparam('rollup_id')).values(
+                {name: bindparam(name) for name in ('count', 'total_time', 'max_time', 'p50', 'p95', 'p99', 'histogram')}
+            ),
+            updates
+        )
+
+
+def compact_request_logs(engine, batch_size=5000, retention_days=30,
+                         minute_retention_days=7, hour_retention_days=90):
+    """Fold new RequestLog rows into the rollups, then apply the retention windows.
+
+    Raw rows are only deleted once they are older than `retention_days` and below
+    the watermark; day rollups are kept forever. Returns (rolled_up, deleted).
+    """
+    rolled_up = 0
+    while True:
+        with engine.begin() as conn:
+            # Take the write lock before reading the watermark, so a second compaction (the
+            # scheduled job and a dashboard, or another process) waits and then starts
+            # after this one's rows instead of folding them again
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            watermark = get_watermark(conn)
+            rows = conn.execute(
+                select(logs.c.id, logs.c.timestamp, logs.c.endpoint, logs.c.method,
+                       logs.c.status_code, logs.c.response_time)
+                .where(logs.c.id > watermark, logs.c.timestamp.isnot(None))
+                .order_by(logs.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            _fold(conn, rows)
+            _set_watermark(conn, rows[-1].id)
+        rolled_up += len(rows)
+
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        deleted = conn.execute(delete(logs).where(
+            logs.c.timestamp < now - timedelta(days=retention_days),
+            logs.c.id <= get_watermark(conn)
+        )).rowcount
+        for resolution, days in (('minute', minute_retention_days), ('hour', hour_retention_days)):
+            conn.execute(delete(rollups).where(
+                rollups.c.resolution == resolution,
+                rollups.c.bucket_start < bucket_start(now - timedelta(days=days), resolution)
+            ))
+    return rolled_up, deleted
+
+
+def oldest_unrolled(conn):
+    """Timestamp of the oldest request log not folded into the rollups yet, or None"""
+    return conn.execute(
+        select(logs.c.timestamp).where(logs.c.id > get_watermark(conn), logs.c.timestamp.isnot(None))
+        .order_by(logs.c.id).limit(1)
+    ).scalar()
+
+
+def request_totals(conn):
+    """(method, status_code, count) over all requests ever logged: the day rollups plus the raw
+    rows not rolled up yet, so totals survive the raw rows being deleted"""
+    watermark = get_watermark(conn)
+    totals = defaultdict(int)
+    for method, status_code, count in conn.execute(
+        select(rollups.c.method, rollups.c.status_code, rollups.c.count).where(rollups.c.resolution == 'day')
+    ):
+        totals[(method, status_code)] += count
+    for method, status_code in conn.execute(select(logs.c.method, logs.c.status_code).where(logs.c.id > watermark)):
+        totals[(method or '', status_code or 0)] += 1
+    return [(method, status_code, count) for (method, status_code), count in totals.items()]
+
+
+def summarize(session, since, resolution='hour', group_by_endpoint=False):
+    """Merge the rollups since `since` into overall (or per-endpoint) count/avg/p95/error stats"""
+    merged = defaultdict(Bucket)
+    errors = defaultdict(int)
+    for row in session.query(RequestLogRollup).filter(
+        RequestLogRollup.resolution == resolution,
+        RequestLogRollup.bucket_start >= bucket_start(since, resolution)
+    ):
+        key = row.endpoint if group_by_endpoint else None
+        merged[key].merge(Bucket(count=row.count, total_time=row.total_time, max_time=row.max_time,
+                                 histogram=json.loads(row.histogram)))
+        if row.status_code >= 400:
+            errors[key] += row.count
+
+    summary = []
+    for key, bucket in merged.items():
+        summary.append({
+            'endpoint': key,
+            'count': bucket.count,
+            'errors': errors[key],
+            'avg_time': bucket.total_time / bucket.count if bucket.count else 0,
+            'p95': percentile(bucket.histogram, 0.95, bucket.max_time) or 0,
+            'max_time': bucket.max_time,
+        })
+    summary.sort(key=lambda item: item['count'], reverse=True)
+    if group_by_endpoint:
+        return summary
+    return summary[0] if summary else {'endpoint': None, 'count': 0, 'errors': 0, 'avg_time': 0, 'p95': 0, 'max_time': 0}
@@ -1,4 +1,7 @@
-from app import app
+from app import create_app
+
+# The development server is the only process, so it also runs the scheduled jobs
+app = create_app({'SCHEDULER_ENABLED': True})
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001) 
\ No newline at end of file
+    app.run(debug=True, port=5001) 
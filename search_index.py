@@ -0,0 +1,109 @@
+import logging
+import re
+
+from sqlalchemy import func, literal_column, select, table, column
+from sqlalchemy.exc import OperationalError
+
+# Book columns mirrored into the FTS5 table, with their BM25 weights
+FTS_COLUMNS = ('title', 'author', 'isbn', 'categories', 'tags')
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 2.0, 2.0)
+
+# ISBNs are indexed without hyphens or spaces, so a prefix of the bare digits finds
+# "978-0-306-40615-7" as well as "9780306406157"
+ISBN_SQL = "replace(replace({}.isbn, '-', ''), ' ', '')"
+TRIGGERS = ('books_fts_ai', 'books_fts_ad', 'books_fts_au')
+
+
+def _values(row):
+    return ', '.join(ISBN_SQL.format(row) if c == 'isbn' else f'{row}.{c}' for c in FTS_COLUMNS)
+
+
+_cols = ', '.join(FTS_COLUMNS)
+_new = _values('new')
+_old = _values('old')
+
+# External-content FTS5 table over `books`, kept in sync by triggers so every
+# write path (ORM, bulk inserts, raw SQL) updates the index. The 'delete' entries must
+# carry the same values that were indexed, so they go through ISBN_SQL too
+CREATE_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+    f"{_cols}, content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+    f"INSERT INTO books_fts(rowid, {_cols}) VALUES (new.id, {_new}); END",
+    f"CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+    f"INSERT INTO books_fts(books_fts, rowid, {_cols}) VALUES ('delete', old.id, {_old}); END",
+    f"CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF {_cols} ON books BEGIN "
+    f"INSERT INTO books_fts(books_fts, rowid, {_cols}) VALUES ('delete', old.id, {_old}); "
+    f"INSERT INTO books_fts(rowid, {_cols}) VALUES (new.id, {_new}); END",
+]
+
+books_fts = table('books_fts', column('rowid'))
+
+
+def create_search_index(engine):
+    """Create the FTS table and triggers if missing; returns False when SQLite lacks FTS5"""
+    try:
+        with engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+            ).first()
+            # Indexes from before ISBNs were stripped of hyphens get new triggers and contents
+            stale = exists and not conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'books_fts_ai' "
+                "AND sql LIKE '%replace(%'"
+            ).first()
+            if stale:
+                for trigger in TRIGGERS:
+                    conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            for statement in CREATE_STATEMENTS:
+                conn.exec_driver_sql(statement)
+            if not exists or stale:
+                # Index the books that were there before the FTS table (or the new triggers)
+                _repopulate(conn)
+        return True
+    except OperationalError as e:
+        logging.warning(f"Full-text search disabled, could not create FTS5 index: {e}")
+        return False
+
+
+def _repopulate(conn):
+    # Not FTS5's 'rebuild', which reads the raw columns from books and so can't apply ISBN_SQL
+    conn.exec_driver_sql("INSERT INTO books_fts(books_fts) VALUES ('delete-all')")
+    conn.exec_driver_sql(f"INSERT INTO books_fts(rowid, {_cols}) SELECT id, {_values('books')} FROM books")
+
+
+def rebuild_search_index(engine):
+    with engine.begin() as conn:
+        _repopulate(conn)
+
+
+def build_match_query(search, field=None):
+    """Turn free text into an FTS5 MATCH expression of prefix terms, optionally limited to one column.
+
+    Returns None when the text has nothing searchable in it.
+    """
+    prefix = f'{field} : ' if field else ''
+    if field == 'isbn':
+        # ISBNs are indexed without hyphens, so match the digits as a single prefix
+        term = ''.join(c for c in search if c.isalnum())
+        return f'{prefix}"{term}"*' if term else None
+
+    parts = []
+    for group in re.findall(r'\w+(?:-\w+)*', search, re.UNICODE):
+        words = group.split('-')
+        expr = ' AND '.join(f'{prefix}"{word}"*' for word in words)
+        if len(words) > 1 and any(c.isdigit() for c in group):
+            # A hyphenated number may be an ISBN, indexed as one run of digits
+            expr = f'({prefix}"{"".join(words)}"* OR ({expr}))'
+        parts.append(expr)
+    return ' AND '.join(parts) or None
+
+
+def search_matches(match):
+    """Subquery of (rowid, rank) for books matching an FTS5 expression; lower rank is more relevant"""
+    return select(
+        books_fts.c.rowid.label('book_id'),
+        func.bm25(literal_column('books_fts'), *FTS_WEIGHTS).label('rank')
+    ).where(
+        literal_column('books_fts').op('MATCH')(match)
+    ).subquery('fts_matches')
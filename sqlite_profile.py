@@ -0,0 +1,87 @@
+import logging
+
+from sqlalchemy import event
+
+# Pragmas run on every new SQLite connection, by profile name. Negative cache_size is
+# in KiB per connection; busy_timeout is in milliseconds
+PROFILES = {
+    # Readers keep going while the request log writer commits. NORMAL sync is safe in WAL
+    # mode: a power cut can lose the last few commits but can't corrupt the database
+    'wal': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16 * 1024,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    # WAL, but every commit is synced to disk before it returns
+    'durable': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16 * 1024,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    # SQLite's own defaults (rollback journal), as the app ran before profiles existed
+    'rollback': {
+        'busy_timeout': 5000,
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+}
+DEFAULT_PROFILE = 'wal'
+
+
+def resolve(profile=None, overrides=None):
+    """The pragmas for `profile`, with `overrides` (name -> value, None to drop one) on top"""
+    profile = profile or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile {profile!r}, expected one of {', '.join(PROFILES)}")
+    pragmas = dict(PROFILES[profile])
+    for name, value in (overrides or {}).items():
+        if value is None:
+            pragmas.pop(name, None)
+        else:
+            pragmas[name] = value
+    return pragmas
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            try:
+                cursor.execute(f'PRAGMA {name} = {value}')
+            except Exception as e:
+                # e.g. switching journal mode while another connection holds a lock;
+                # the connection still works, just without this setting
+                logging.warning(f"Could not set PRAGMA {name} = {value}: {e}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine, profile=None, overrides=None):
+    """Apply a pragma profile to every connection `engine` opens from now on.
+
+    Connections already in the pool were opened without it, so the pool is emptied.
+    Returns the pragmas in effect.
+    """
+    pragmas = resolve(profile, overrides)
+    if engine.dialect.name != 'sqlite':
+        return {}
+
+    def on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+    event.listen(engine, 'connect', on_connect)
+    engine.dispose()
+    return pragmas
+
+
+def read_pragmas(engine, names):
+    """Current value of each pragma on a pooled connection, for checking a profile took"""
+    with engine.connect() as conn:
+        return {name: conn.exec_driver_sql(f'PRAGMA {name}').scalar() for name in names}
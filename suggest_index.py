@@ -0,0 +1,182 @@
+import re
+import threading
+import unicodedata
+import weakref
+from bisect import bisect_left, insort
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import Book
+
+# Keys are cut to this many characters so long titles don't bloat the index; longer
+# queries are checked against the full normalized text
+KEY_LENGTH = 32
+# Index entries looked at per query before ranking
+SCAN_LIMIT = 100
+
+_non_word = re.compile(r'[^\w]+')
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _non_word.sub(' ', text.casefold()).strip()
+
+
+def _keys(title, author):
+    """Every word-suffix of the title and author, so "pott" finds "Harry Potter" """
+    keys = set()
+    for text in (title, author):
+        words = text.split()
+        for i in range(len(words)):
+            keys.add(' '.join(words[i:])[:KEY_LENGTH])
+    return keys
+
+
+class SuggestIndex:
+    """In-memory sorted prefix index over active books' titles and authors.
+
+    Lookups bisect into a sorted list of (key, book id) pairs. Book changes are picked up
+    from ORM flushes and applied once their transaction commits to the database the index
+    was built from; writes that bypass the session (bulk core inserts, restores) call
+    build() afterwards.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self._entries = []
+        self._books = {}
+        self._lock = threading.Lock()
+        _indexes.add(self)
+
+    def build(self, engine):
+        self.engine = engine
+        books = Book.__table__
+        with engine.connect() as conn:
+            rows = conn.execute(select(books.c.id, books.c.title, books.c.author, books.c.copy_number)
+                                .where(books.c.deleted == False)).all()
+        entries, book_map = [], {}
+        for row in rows:
+            record = self._record(row.title, row.author, row.copy_number)
+            book_map[row.id] = record
+            entries.extend((key, row.id) for key in record[3])
+        entries.sort()
+        with self._lock:
+            self._entries, self._books = entries, book_map
+        return len(book_map)
+
+    def __len__(self):
+        return len(self._books)
+
+    @staticmethod
+    def _record(title, author, copy_number):
+        norm_title, norm_author = normalize(title), normalize(author)
+        return (title or '', author or '', copy_number, _keys(norm_title, norm_author), norm_title, norm_author)
+
+    def _remove(self, book_id):
+        record = self._books.pop(book_id, None)
+        if record is None:
+            return
+        for key in record[3]:
+            i = bisect_left(self._entries, (key, book_id))
+            if i < len(self._entries) and self._entries[i] == (key, book_id):
+                del self._entries[i]
+
+    def update(self, book_id, title, author, copy_number=1, deleted=False):
+        with self._lock:
+            self._remove(book_id)
+            if deleted:
+                return
+            record = self._record(title, author, copy_number)
+            self._books[book_id] = record
+            for key in record[3]:
+                insort(self._entries, (key, book_id))
+
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def candidates(self, query):
+        """Book ids with a title or author word starting with `query`, best matches first"""
+        q = normalize(query)
+        if not q:
+            return []
+        prefix = q[:KEY_LENGTH]
+        long_query = len(q) > KEY_LENGTH
+        seen = {}
+        with self._lock:
+            start = bisect_left(self._entries, (prefix,))
+            window = self._entries[start:start + SCAN_LIMIT]
+            books = self._books
+        for key, book_id in window:
+            if not key.startswith(prefix):
+                break
+            if book_id in seen:
+                continue
+            record = books.get(book_id)
+            if record is None or (long_query and f' {q}' not in f' {record[4]}' and f' {q}' not in f' {record[5]}'):
+                continue
+            # Title starting with the query first, then author, then any other word
+            rank = 0 if record[4].startswith(q) else 1 if record[5].startswith(q) else 2
+            seen[book_id] = (rank, record[4], book_id)
+        return [book_id for _, _, book_id in sorted(seen.values())]
+
+    def describe(self, book_ids, limit=10, exclude=()):
+        """Title/author details for the first `limit` of `book_ids` not in `exclude`"""
+        results = []
+        for book_id in book_ids:
+            if book_id in exclude:
+                continue
+            record = self._books.get(book_id)
+            if record is None:
+                continue
+            results.append({'id': book_id, 'title': record[0], 'author': record[1], 'copy_number': record[2]})
+            if len(results) >= limit:
+                break
+        return results
+
+    def apply(self, changes):
+        for book_id, values in changes.items():
+            if values is None:
+                self.remove(book_id)
+            else:
+                self.update(book_id, *values)
+
+
+# Every live index; the session hooks below are registered once and feed all of them, so
+# building an app (and its index) again doesn't pile up listeners
+_indexes = weakref.WeakSet()
+
+
+# Session hooks: remember the books a flush touched, apply them when the transaction commits
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    changes = session.info.setdefault('suggest_changes', {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Book) and obj.id is not None:
+            changes[obj.id] = (obj.title, obj.author, obj.copy_number, bool(obj.deleted))
+    for obj in session.deleted:
+        if isinstance(obj, Book) and obj.id is not None:
+            changes[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    changes = session.info.pop('suggest_changes', None)
+    if not changes:
+        return
+    bind = session.get_bind(Book.__mapper__)
+    engine = getattr(bind, 'engine', bind)
+    for index in list(_indexes):
+        if index.engine is None or index.engine is engine:
+            index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('suggest_changes', None)
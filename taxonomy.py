@@ -0,0 +1,112 @@
+from sqlalchemy import event, inspect, select, insert, delete
+from sqlalchemy.orm import Session
+
+from models import Book, Category, Tag, book_categories, book_tags
+
+
+def split_names(value):
+    """Split a comma-separated categories/tags string into unique, trimmed names (order kept)"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        value = ','.join(value)
+    return list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+
+
+def _changed(book, attr):
+    state = inspect(book)
+    return state.pending or state.attrs[attr].history.has_changes()
+
+
+def _resolve(session, model, names):
+    """Map names to rows of `model`, creating the missing ones in one pass"""
+    if not names:
+        return {}
+    with session.no_autoflush:
+        found = {row.name: row for row in session.query(model).filter(model.name.in_(names)).all()}
+    for name in names:
+        if name not in found:
+            found[name] = model(name=name)
+            session.add(found[name])
+    return found
+
+
+@event.listens_for(Session, 'before_flush')
+def sync_book_taxonomy(session, flush_context, instances):
+    """Keep the category/tag link tables in step with the Book.categories and Book.tags strings"""
+    books = [obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, Book)]
+    category_books = [b for b in books if _changed(b, 'categories')]
+    tag_books = [b for b in books if _changed(b, 'tags')]
+    if not category_books and not tag_books:
+        return
+
+    categories = _resolve(session, Category, {n for b in category_books for n in split_names(b.categories)})
+    tags = _resolve(session, Tag, {n for b in tag_books for n in split_names(b.tags)})
+
+    for book in category_books:
+        book.category_entries = [categories[n] for n in split_names(book.categories)]
+    for book in tag_books:
+        book.tag_entries = [tags[n] for n in split_names(book.tags)]
+
+
+def _link_names(conn, name_table, link_table, fk, rows):
+    """Replace the links for the given (book_id, names) rows using set-based core statements"""
+    book_ids = [book_id for book_id, _ in rows]
+    conn.execute(delete(link_table).where(link_table.c.book_id.in_(book_ids)))
+
+    names = {name for _, book_names in rows for name in book_names}
+    if not names:
+        return
+    existing = dict(conn.execute(select(name_table.c.name, name_table.c.id).where(name_table.c.name.in_(names))).all())
+    missing = [{'name': name} for name in names if name not in existing]
+    if missing:
+        conn.execute(insert(name_table), missing)
+        existing = dict(conn.execute(select(name_table.c.name, name_table.c.id).where(name_table.c.name.in_(names))).all())
+
+    links = [{'book_id': book_id, fk: existing[name]} for book_id, book_names in rows for name in book_names]
+    if links:
+        conn.execute(insert(link_table), links)
+
+
+def sync_taxonomy_rows(conn, rows):
+    """Rebuild category/tag links for raw (id, categories, tags) book rows, e.g. after bulk inserts"""
+    rows = list(rows)
+    if not rows:
+        return
+    _link_names(conn, Category.__table__, book_categories, 'category_id',
+                [(row[0], split_names(row[1])) for row in rows])
+    _link_names(conn, Tag.__table__, book_tags, 'tag_id',
+                [(row[0], split_names(row[2])) for row in rows])
+
+
+def backfill_taxonomy(engine, batch_size=500):
+    """Populate the link tables from every book's categories/tags strings, one batch per transaction"""
+    books = Book.__table__
+    last_id = 0
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(books.c.id, books.c.categories, books.c.tags)
+                .where(books.c.id > last_id)
+                .order_by(books.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return total
+            sync_taxonomy_rows(conn, rows)
+        last_id = rows[-1][0]
+        total += len(rows)
+
+
+def needs_backfill(engine):
+    """True when books carry categories/tags but the link tables were never populated"""
+    books = Book.__table__
+    with engine.connect() as conn:
+        has_links = conn.execute(select(book_categories.c.book_id).limit(1)).first() or \
+            conn.execute(select(book_tags.c.book_id).limit(1)).first()
+        if has_links:
+            return False
+        return conn.execute(
+            select(books.c.id).where((books.c.categories != '') | (books.c.tags != '')).limit(1)
+        ).first() is not None